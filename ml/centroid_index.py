@@ -0,0 +1,62 @@
+import json
+import os
+import numpy as np
+from scipy.spatial import cKDTree
+
+FORMAT_VERSION = 1
+
+
+class CentroidIndex(object):
+
+    def __init__(self, centers, hotspot=None, bitmap=None):
+        self._centers = np.asanyarray(centers, dtype='float32').reshape(-1, 2)
+        if bitmap is None:
+            if hotspot is None:
+                hotspot = np.zeros(len(self._centers), dtype='bool')
+            bitmap = np.packbits(np.asarray(hotspot, dtype='bool'))
+        self._bitmap = bitmap
+        self._tree = cKDTree(self._centers)
+
+    def get_n_clusters(self):
+        return len(self._centers)
+
+    def get_centers(self):
+        return self._centers
+
+    def query(self, points):
+        points = np.asarray(points, dtype='float64').reshape(-1, 2)
+        _, clusters = self._tree.query(points)
+        return clusters
+
+    def is_hotspot(self, clusters):
+        clusters = np.asarray(clusters, dtype='int64')
+        return (self._bitmap[clusters >> 3] >> (7 - (clusters & 7))) & 1 == 1
+
+    def save_to(self, address):
+        prefix = os.path.splitext(address)[0]
+        files = {'centers': prefix + '.centers.npy', 'hotspot': prefix + '.hotspot.npy'}
+        for name, array in [('centers', self._centers), ('hotspot', self._bitmap)]:
+            with open(files[name] + '.tmp', 'wb') as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(files[name] + '.tmp', files[name])
+        with open(address + '.tmp', 'w') as f:
+            json.dump({
+                'format': FORMAT_VERSION,
+                'n_clusters': self.get_n_clusters(),
+                'centers': os.path.basename(files['centers']),
+                'hotspot': os.path.basename(files['hotspot'])
+            }, f)
+        os.replace(address + '.tmp', address)
+
+    @staticmethod
+    def load(address):
+        with open(address) as f:
+            meta = json.load(f)
+        if meta.get('format') != FORMAT_VERSION:
+            raise ValueError('Formato de índice não suportado: {0}'.format(meta.get('format')))
+        directory = os.path.dirname(address)
+        centers = np.load(os.path.join(directory, meta['centers']), mmap_mode='r')
+        bitmap = np.load(os.path.join(directory, meta['hotspot']), mmap_mode='r')
+        if centers.shape != (meta['n_clusters'], 2) or len(bitmap) != (meta['n_clusters'] + 7) // 8:
+            raise ValueError('Índice inconsistente: {0}'.format(address))
+        return CentroidIndex(centers, bitmap=bitmap)
@@ -0,0 +1,69 @@
+import time
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+from ml.hotspot_predictor import HotspotPredictor
+
+
+class ClusterSweep(object):
+
+    def __init__(self, df, candidates, n_jobs=1, sample_size=5000, seed=0):
+        self._coordinates = df[['LATITUDE', 'LONGITUDE']].to_numpy(dtype='float64')
+        self._months = df['MES'].to_numpy()
+        self._n_months = int(self._months.max())
+        self._sample_size = sample_size
+        self._seed = seed
+        candidates = sorted(set(int(k) for k in candidates if 2 <= k < len(self._coordinates)))
+        self._scores = Parallel(n_jobs=n_jobs)(delayed(self._score)(k) for k in candidates)
+
+    def get_scores(self):
+        return self._scores
+
+    def get_best(self):
+        if not self._scores:
+            return None
+        return max(self._scores, key=lambda score: (score['score'], -score['n_clusters']))['n_clusters']
+
+    @staticmethod
+    def get_candidates(min_clusters, max_clusters, steps):
+        return sorted(set(np.geomspace(max(min_clusters, 2), max(max_clusters, 2), steps).round().astype(int).tolist()))
+
+    def _score(self, n_clusters):
+        start = time.perf_counter()
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, init_size=3 * n_clusters, max_iter=10000,
+                                 random_state=self._seed)
+        labels = kmeans.fit_predict(self._coordinates)
+        fit_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rng = np.random.default_rng(self._seed)
+        half = rng.choice(len(self._coordinates), len(self._coordinates) // 2, replace=False)
+        resampled = MiniBatchKMeans(n_clusters=n_clusters, init_size=3 * n_clusters, max_iter=10000,
+                                    random_state=self._seed + 1).fit(self._coordinates[half])
+        stability = np.mean(self._get_hotspot(labels, n_clusters) ==
+                            self._get_hotspot(resampled.predict(self._coordinates), n_clusters))
+        silhouette = self._get_silhouette(labels)
+        return {
+            'n_clusters': n_clusters,
+            'inertia': float(kmeans.inertia_),
+            'silhouette': silhouette,
+            'stability': float(stability),
+            'score': silhouette * float(stability),
+            'fit_time': fit_time,
+            'score_time': time.perf_counter() - start
+        }
+
+    def _get_hotspot(self, labels, n_clusters):
+        counts = pd.DataFrame({'GRUPO': labels, 'MES': self._months}).groupby(['GRUPO', 'MES']).size().reset_index()
+        counts.columns = ['GRUPO', 'MES', 'COUNT']
+        y_pred = HotspotPredictor.predict_counts(counts, n_clusters, self._n_months + 1) >= counts['COUNT'].median()
+        return y_pred[labels]
+
+    def _get_silhouette(self, labels):
+        sample_size = min(self._sample_size, len(labels))
+        idxs = np.random.default_rng(self._seed).choice(len(labels), sample_size, replace=False)
+        if len(np.unique(labels[idxs])) < 2 or len(np.unique(labels[idxs])) >= sample_size:
+            return 0.0
+        return float(silhouette_score(self._coordinates[idxs], labels[idxs]))
@@ -0,0 +1,34 @@
+import glob
+import os
+from pyarrow import feather
+
+CACHE_SUFFIX = '.v2.feather'
+
+
+def get_cache_path(filepath):
+    return filepath + CACHE_SUFFIX
+
+
+def load(filepath, parse):
+    cachepath = get_cache_path(filepath)
+    try:
+        if os.path.getmtime(cachepath) >= os.path.getmtime(filepath):
+            return feather.read_table(cachepath, memory_map=True).to_pandas()
+    except FileNotFoundError:
+        pass
+    df = parse(filepath)
+    save(df, cachepath)
+    return df
+
+
+def save(df, cachepath):
+    df.reset_index(drop=True).to_feather(cachepath + '.tmp', compression='uncompressed')
+    os.replace(cachepath + '.tmp', cachepath)
+
+
+def remove(filepath):
+    for cachepath in glob.glob(glob.escape(filepath) + '.v*.feather'):
+        try:
+            os.remove(cachepath)
+        except FileNotFoundError:
+            pass
@@ -39,3 +39,23 @@ class NumberClusterForm(forms.Form):
         required=True,
         initial=2000
     )
+
+    incremental = forms.BooleanField(
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        label='Incremental (adiciona os arquivos ao modelo atual)',
+        required=False
+    )
+
+    sweep = forms.BooleanField(
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        label='Escolher o número de agrupamentos automaticamente (até o valor informado)',
+        required=False
+    )
+
+    min_clusters = forms.IntegerField(
+        widget=forms.NumberInput(attrs={'class': 'form-control'}),
+        label='Número mínimo de agrupamentos',
+        required=False,
+        min_value=2,
+        initial=100
+    )
@@ -0,0 +1,106 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from ml import hotspot_regression
+
+FORMAT_VERSION = 1
+WEEKDAYS = 7
+HOURS = 24
+SMOOTHING = 24.0
+
+
+class HotspotCube(object):
+
+    def __init__(self, scores, thresholds, buckets, first_month, last_period=None):
+        self._scores = scores
+        self._thresholds = thresholds
+        self._buckets = buckets
+        self._first_month = int(first_month)
+        self._last_period = last_period
+
+    @classmethod
+    def build(cls, df, counts, n_clusters, horizon):
+        return cls.from_buckets(cls.get_buckets(df, n_clusters), counts, horizon, cls.get_period(df))
+
+    @classmethod
+    def from_buckets(cls, buckets, counts, horizon, last_period=None):
+        n_clusters = len(buckets)
+        n_months = int(counts['MES'].max())
+        predicted = np.stack([hotspot_regression.predict_counts(counts, n_clusters, n_months + step)
+                              for step in range(1, horizon + 1)], axis=1)
+        totals = buckets.sum(axis=(1, 2))
+        shares = np.full((WEEKDAYS, HOURS), 1.0 / (WEEKDAYS * HOURS))
+        if totals.sum():
+            shares = buckets.sum(axis=0) / totals.sum()
+        cluster_shares = (buckets + SMOOTHING * shares) / (totals + SMOOTHING)[:, None, None]
+        scores = predicted[:, :, None, None] * cluster_shares[:, None, :, :]
+        thresholds = counts['COUNT'].median() * shares
+        return cls(scores.astype('float32'), thresholds.astype('float32'), buckets.astype('int32'), n_months + 1,
+                   last_period)
+
+    def extend(self, df, counts, horizon):
+        buckets = np.asarray(self._buckets) + self.get_buckets(df, len(self._buckets))
+        periods = [period for period in [self._last_period, self.get_period(df)] if period is not None]
+        return self.from_buckets(buckets, counts, horizon, max(periods) if periods else None)
+
+    def get_n_clusters(self):
+        return len(self._scores)
+
+    def get_months(self):
+        return range(self._first_month, self._first_month + self._scores.shape[1])
+
+    def get_month(self, time):
+        if self._last_period is None:
+            raise ValueError('Período dos dados desconhecido')
+        return self._first_month + time.year * 12 + time.month - 1 - self._last_period - 1
+
+    def query(self, month, weekday, hour, clusters=None):
+        if month not in self.get_months() or not 0 <= weekday < WEEKDAYS or not 0 <= hour < HOURS:
+            raise ValueError('Horizonte fora do intervalo: {0}'.format(month))
+        scores = self._scores[:, month - self._first_month, weekday, hour]
+        if clusters is not None:
+            scores = scores[np.asarray(clusters, dtype='int64')]
+        return scores, scores >= self._thresholds[weekday, hour]
+
+    def save_to(self, address):
+        prefix = os.path.splitext(address)[0]
+        arrays = {'scores': self._scores, 'thresholds': self._thresholds, 'buckets': self._buckets}
+        files = {name: prefix + '.' + name + '.npy' for name in arrays}
+        for name, array in arrays.items():
+            with open(files[name] + '.tmp', 'wb') as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(files[name] + '.tmp', files[name])
+        with open(address + '.tmp', 'w') as f:
+            json.dump(dict({name: os.path.basename(filename) for name, filename in files.items()},
+                           format=FORMAT_VERSION, n_clusters=self.get_n_clusters(), horizon=len(self.get_months()),
+                           first_month=self._first_month, last_period=self._last_period), f)
+        os.replace(address + '.tmp', address)
+
+    @staticmethod
+    def load(address):
+        with open(address) as f:
+            meta = json.load(f)
+        if meta.get('format') != FORMAT_VERSION:
+            raise ValueError('Formato de cubo não suportado: {0}'.format(meta.get('format')))
+        directory = os.path.dirname(address)
+        arrays = [np.load(os.path.join(directory, meta[name]), mmap_mode='r')
+                  for name in ['scores', 'thresholds', 'buckets']]
+        if arrays[0].shape != (meta['n_clusters'], meta['horizon'], WEEKDAYS, HOURS):
+            raise ValueError('Cubo inconsistente: {0}'.format(address))
+        return HotspotCube(*arrays, meta['first_month'], meta['last_period'])
+
+    @staticmethod
+    def get_buckets(df, n_clusters):
+        valid = df['DATAHORA'].notna().to_numpy()
+        times = df['DATAHORA'][valid].dt
+        keys = (df['GRUPO'].to_numpy(dtype='int64')[valid] * WEEKDAYS + times.dayofweek.to_numpy()) * HOURS + \
+            times.hour.to_numpy()
+        return np.bincount(keys, minlength=n_clusters * WEEKDAYS * HOURS).reshape(n_clusters, WEEKDAYS, HOURS)
+
+    @staticmethod
+    def get_period(df):
+        last = df['DATAHORA'].max()
+        if pd.isna(last):
+            return None
+        return int(last.year * 12 + last.month - 1)
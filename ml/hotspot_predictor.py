@@ -1,24 +1,42 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import pandas as pd
+from pandas.api.types import union_categoricals
 import numpy as np
-from scipy.spatial import Voronoi
 from sklearn.cluster import MiniBatchKMeans
-from sklearn.preprocessing import OneHotEncoder
-from sklearn.compose import ColumnTransformer
-from sklearn.linear_model import LinearRegression
 from joblib import dump
+from ml import dataframe_cache
+from ml import hotspot_regression
+from ml import voronoi
+from ml.centroid_index import CentroidIndex
 
 
 class HotspotPredictor(object):
+    CATEGORY_COLUMNS = ['DATAOCORRENCIA', 'HORAOCORRENCIA', 'BAIRRO', 'CIDADE']
+    SOLVERS = hotspot_regression.SOLVERS
+    predict_hotspot = staticmethod(hotspot_regression.predict_hotspot)
+    predict_counts = staticmethod(hotspot_regression.predict_counts)
 
-    def __init__(self, filepaths, n_clusters):
+    def __init__(self, filepaths, n_clusters, progress=None, n_jobs=1, chunksize=None):
 
         self._filepaths = filepaths
         self._n_clusters = n_clusters
+        self._n_jobs = n_jobs
+        self._chunksize = chunksize
+        self._progress = progress
+        self._report('dataframe', 0.0)
         self._df = self._get_dataframe()
+        self._report('kmeans', 0.15)
         self._kmeans = self._get_kmeans()
+        self._counts = self._process_dataframe(self._df)
+        self._report('hotspot', 0.2)
         self._hotspot = self._predict_hotspot()
+        self._report('boundaries', 0.5)
         self._boundaries = self._create_boundaries()
-        self._results = self._get_results()
+        self._results = None
+        self._index = CentroidIndex(self._kmeans.cluster_centers_,
+                                    [self._hotspot[cluster] for cluster in range(self._n_clusters)])
 
     def get_kmeans(self):
         return self._kmeans
@@ -33,98 +51,145 @@ class HotspotPredictor(object):
         return self._boundaries
 
     def save_kmeans_to(self, address):
-        dump(self._kmeans, address)
+        dump(self._kmeans, address + '.tmp')
+        os.replace(address + '.tmp', address)
 
     def get_results(self):
+        if self._results is None:
+            self._results = list(self.iter_results())
         return self._results
 
+    def iter_results(self):
+        for cluster, features in self.iter_points(self._df, self._hotspot, self._n_clusters):
+            features.append(self._get_boundary(cluster))
+            yield self._get_feature_collection(features, cluster)
+
+    @staticmethod
+    def iter_points(df, hotspot, n_clusters):
+        clusters = df['GRUPO'].to_numpy()
+        order = np.argsort(clusters, kind='stable')
+        bounds = np.searchsorted(clusters[order], np.arange(n_clusters + 1))
+        latitudes = np.round(df['LATITUDE'].to_numpy(dtype='float64')[order], 6).tolist()
+        longitudes = np.round(df['LONGITUDE'].to_numpy(dtype='float64')[order], 6).tolist()
+        dates = df['DATAOCORRENCIA'].to_numpy()[order].tolist()
+        times = df['HORAOCORRENCIA'].to_numpy()[order].tolist()
+        for cluster in range(n_clusters):
+            is_hotspot = bool(hotspot[cluster])
+            yield cluster, [{
+                'type': 'Feature',
+                'geometry': {
+                    'type': 'Point',
+                    'coordinates': [latitudes[idx], longitudes[idx]]
+                },
+                'properties': {
+                    'date': dates[idx],
+                    'time': times[idx]
+                },
+                'hotspot': is_hotspot,
+                'cluster': cluster
+            } for idx in range(bounds[cluster], bounds[cluster + 1])]
+
+    def get_counts(self):
+        return self._counts
+
+    @staticmethod
+    def get_cluster_dtype(n_clusters):
+        return 'int16' if n_clusters <= np.iinfo('int16').max else 'int32'
+
+    def get_index(self):
+        return self._index
+
+    def save_index_to(self, address):
+        self._index.save_to(address)
+
+    def _report(self, stage, progress):
+        if self._progress is not None:
+            self._progress(stage, progress)
+
     def _get_kmeans(self):
         if self._n_clusters == 0:
             init_clusters = self._df[['BAIRRO', 'CIDADE', 'LATITUDE', 'LONGITUDE']].groupby(
-                ['CIDADE', 'BAIRRO']).mean().dropna().to_numpy()
+                ['CIDADE', 'BAIRRO'], observed=True).mean().dropna().to_numpy()
             self._n_clusters, _ = init_clusters.shape
             return MiniBatchKMeans(n_clusters=self._n_clusters, init_size=self._n_clusters, max_iter=10000,
                                    init=init_clusters)
         else:
             return MiniBatchKMeans(n_clusters=self._n_clusters, init_size=self._n_clusters, max_iter=10000)
 
-    @staticmethod
-    def _load_dataframe(filepath, month):
+    @classmethod
+    def load_dataframe(cls, filepaths, n_jobs=1, chunksize=None, first_month=1):
+        months = range(first_month, first_month + len(filepaths))
+        chunksizes = [chunksize] * len(filepaths)
+        if n_jobs > 1 and len(filepaths) > 1:
+            with ProcessPoolExecutor(max_workers=min(n_jobs, len(filepaths))) as executor:
+                dfs = list(executor.map(cls._load_dataframe, filepaths, months, chunksizes))
+        else:
+            dfs = list(map(cls._load_dataframe, filepaths, months, chunksizes))
+        return cls._concat_dataframes(dfs)
+
+    @classmethod
+    def _concat_dataframes(cls, dfs):
+        for col in cls.CATEGORY_COLUMNS:
+            categories = union_categoricals([df[col] for df in dfs], ignore_order=True).categories
+            for df in dfs:
+                df[col] = df[col].cat.set_categories(categories)
+        return pd.concat(dfs, ignore_index=True)
+
+    @classmethod
+    def _load_dataframe(cls, filepath, month, chunksize=None):
+        df = dataframe_cache.load(filepath, partial(cls._parse_dataframe, chunksize=chunksize))
+        df['MES'] = np.int16(month)
+        return df
+
+    @classmethod
+    def _parse_dataframe(cls, filepath, chunksize=None):
         cols = ['DATAOCORRENCIA', 'HORAOCORRENCIA', 'BAIRRO', 'CIDADE', 'LATITUDE', 'LONGITUDE']
-        df = pd.read_csv(
+        reader = pd.read_csv(
             filepath_or_buffer=filepath,
             encoding='utf-16 le',
             delimiter='\t',
             decimal=',',
             dayfirst=True,
-            usecols=cols
+            usecols=cols,
+            chunksize=chunksize
         )
-        df['MES'] = month
-        return df
+        if chunksize is None:
+            return cls._clear_dataframe(reader)
+        fingerprints = set()
+        with reader:
+            chunks = [cls._clear_dataframe(cls._drop_seen(chunk, fingerprints)) for chunk in reader]
+        return cls._concat_dataframes(chunks)
 
     @staticmethod
-    def _clear_dataframe(df):
+    def _drop_seen(df, fingerprints):
+        hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+        unseen = np.fromiter((h not in fingerprints for h in hashes), dtype='bool', count=len(hashes))
+        unseen &= ~pd.Series(hashes).duplicated().to_numpy()
+        fingerprints.update(hashes[unseen].tolist())
+        return df[unseen].copy()
+
+    @classmethod
+    def _clear_dataframe(cls, df):
         df.drop_duplicates(inplace=True)
-        df['LATITUDE'] = pd.to_numeric(df['LATITUDE'], errors='coerce')
-        df['LONGITUDE'] = pd.to_numeric(df['LONGITUDE'], errors='coerce')
+        df['LATITUDE'] = pd.to_numeric(df['LATITUDE'], errors='coerce').astype('float32')
+        df['LONGITUDE'] = pd.to_numeric(df['LONGITUDE'], errors='coerce').astype('float32')
         df.dropna(inplace=True)
-        return df
+        df['DATAHORA'] = pd.to_datetime(df['DATAOCORRENCIA'] + ' ' + df['HORAOCORRENCIA'], dayfirst=True,
+                                        errors='coerce')
+        return df.astype({col: 'category' for col in cls.CATEGORY_COLUMNS})
 
     def _get_dataframe(self):
-        df = pd.concat([self._load_dataframe(filepath, idx + 1) for idx, filepath in enumerate(self._filepaths)])
-        return self._clear_dataframe(df)
+        return self.load_dataframe(self._filepaths, self._n_jobs, self._chunksize)
 
     def _process_dataframe(self, df):
-        df['GRUPO'] = self._kmeans.fit_predict(df[['LATITUDE', 'LONGITUDE']])
+        df['GRUPO'] = self._kmeans.fit_predict(df[['LATITUDE', 'LONGITUDE']].to_numpy()).astype(
+            self.get_cluster_dtype(self._n_clusters))
         df = df.groupby(['GRUPO', 'MES']).size().reset_index()
         df.columns = ['GRUPO', 'MES', 'COUNT']
-
-        pipeline = ColumnTransformer([
-            ('grupo', OneHotEncoder(categories=[np.arange(self._n_clusters, dtype='int32')]), ['GRUPO']),
-            ('mes', 'passthrough', ['MES'])
-        ])
-        X = pipeline.fit_transform(df)
-        y = df['COUNT']
-        return X, y
+        return df
 
     def _predict_hotspot(self):
-        X_train, y_train = self._process_dataframe(self._df)
-        threshold = y_train.median()
-
-        lr = LinearRegression()
-        lr.fit(X_train, y_train)
-        X_pred = np.c_[np.identity(self._n_clusters), np.ones(self._n_clusters) * (len(self._filepaths) + 1)]
-        y_pred = lr.predict(X_pred) >= threshold
-
-        hotspot = dict()
-        for i in range(self._n_clusters):
-            hotspot[i] = y_pred[i]
-        return hotspot
-
-    def _get_results(self):
-        results = []
-        for cluster in range(self._n_clusters):
-            df = self._df[self._df['GRUPO'] == cluster]
-            features = [self._get_point(row['LATITUDE'], row['LONGITUDE'], row['DATAOCORRENCIA'], row['HORAOCORRENCIA'],
-                                        cluster) for idx, row in df.iterrows()]
-            features.append(self._get_boundary(cluster))
-            results.append(self._get_feature_collection(features, cluster))
-        return results
-
-    def _get_point(self, latitude, longitude, date, time, cluster):
-        return {
-            'type': 'Feature',
-            'geometry': {
-                'type': 'Point',
-                'coordinates': [latitude, longitude]
-            },
-            'properties': {
-                'date': date,
-                'time': time
-            },
-            'hotspot': bool(self._hotspot[cluster]),
-            'cluster': cluster
-        }
+        return self.predict_hotspot(self._counts, self._n_clusters, len(self._filepaths) + 1)
 
     def _get_boundary(self, cluster):
         return {
@@ -145,64 +210,5 @@ class HotspotPredictor(object):
             'cluster': cluster
         }
 
-    @staticmethod
-    def voronoi_finite_polygons_2d(vor, radius=None):
-        if vor.points.shape[1] != 2:
-            raise ValueError("Requires 2D input")
-
-        new_regions = []
-        new_vertices = vor.vertices.tolist()
-
-        center = vor.points.mean(axis=0)
-        if radius is None:
-            radius = vor.points.ptp().max() * 2
-
-        all_ridges = {}
-        for (p1, p2), (v1, v2) in zip(vor.ridge_points, vor.ridge_vertices):
-            all_ridges.setdefault(p1, []).append((p2, v1, v2))
-            all_ridges.setdefault(p2, []).append((p1, v1, v2))
-
-        for p1, region in enumerate(vor.point_region):
-            vertices = vor.regions[region]
-
-            if all([v >= 0 for v in vertices]):
-                new_regions.append(vertices)
-                continue
-
-            ridges = all_ridges.get(p1, [])
-            new_region = [v for v in vertices if v >= 0]
-
-            for p2, v1, v2 in ridges:
-                if v2 < 0:
-                    v1, v2 = v2, v1
-                if v1 >= 0:
-                    continue
-
-                t = vor.points[p2] - vor.points[p1]
-                t /= np.linalg.norm(t)
-                n = np.array([-t[1], t[0]])
-
-                midpoint = vor.points[[p1, p2]].mean(axis=0)
-                direction = np.sign(np.dot(midpoint - center, n)) * n
-                far_point = vor.vertices[v2] + direction * radius
-
-                new_region.append(len(new_vertices))
-                new_vertices.append(far_point.tolist())
-
-            vs = np.asarray([new_vertices[v] for v in new_region])
-            c = vs.mean(axis=0)
-            angles = np.arctan2(vs[:, 1] - c[1], vs[:, 0] - c[0])
-            new_region = np.array(new_region)[np.argsort(angles)]
-            new_regions.append(new_region.tolist())
-
-        return new_regions, np.asarray(new_vertices)
-
     def _create_boundaries(self):
-        boundaries = {}
-        points = self._kmeans.cluster_centers_
-        clusters = self._kmeans.predict(points)
-        vor = Voronoi(points)
-        regions, vertices = self.voronoi_finite_polygons_2d(vor)
-        for cluster, region in zip(clusters, regions):
-            boundaries[cluster] = vertices[region].tolist()
-        return boundaries
+        return voronoi.get_boundaries(self._kmeans.cluster_centers_)
@@ -0,0 +1,53 @@
+import numpy as np
+from scipy import sparse
+
+SOLVERS = ['closed_form', 'sparse']
+
+
+def predict_hotspot(counts, n_clusters, month, solver='closed_form'):
+    y_pred = predict_counts(counts, n_clusters, month, solver) >= counts['COUNT'].median()
+
+    hotspot = dict()
+    for i in range(n_clusters):
+        hotspot[i] = y_pred[i]
+    return hotspot
+
+
+def predict_counts(counts, n_clusters, month, solver='closed_form'):
+    if solver not in SOLVERS:
+        raise ValueError('Solver inválido: {0}'.format(solver))
+    clusters = counts['GRUPO'].to_numpy(dtype='int64')
+    months = counts['MES'].to_numpy(dtype='float64')
+    y_train = counts['COUNT'].to_numpy(dtype='float64')
+    if solver == 'sparse':
+        return _solve_sparse(clusters, months, y_train, n_clusters, month)
+    return _solve_closed_form(clusters, months, y_train, n_clusters, month)
+
+
+def _solve_closed_form(clusters, months, y_train, n_clusters, month):
+    sizes = np.bincount(clusters, minlength=n_clusters)
+    observed = sizes > 0
+    mean_months = np.bincount(clusters, months, n_clusters) / np.maximum(sizes, 1)
+    mean_counts = np.bincount(clusters, y_train, n_clusters) / np.maximum(sizes, 1)
+    deviations = months - mean_months[clusters]
+    sxx = deviations @ deviations
+    slope = (deviations @ (y_train - mean_counts[clusters])) / sxx if sxx > 0 else 0.0
+    intercepts = mean_counts - slope * mean_months
+    intercepts[~observed] = intercepts[observed].mean()
+    return intercepts + slope * month
+
+
+def _solve_sparse(clusters, months, y_train, n_clusters, month):
+    from sklearn.linear_model import LinearRegression
+    n_rows = len(clusters)
+    X_train = sparse.hstack([
+        sparse.csr_matrix((np.ones(n_rows), (np.arange(n_rows), clusters)), shape=(n_rows, n_clusters)),
+        sparse.csr_matrix(months.reshape(-1, 1))
+    ], format='csr')
+    lr = LinearRegression()
+    lr.fit(X_train, y_train)
+    X_pred = sparse.hstack([
+        sparse.identity(n_clusters, format='csr'),
+        sparse.csr_matrix(np.full((n_clusters, 1), float(month)))
+    ], format='csr')
+    return lr.predict(X_pred)
@@ -1,40 +1,94 @@
+import os
 import folium
+import numpy as np
+from folium.plugins import FastMarkerCluster
+from folium.plugins import HeatMap
 
 
 class HotspotViewer(object):
+    MODES = ['heatmap', 'cluster', 'circles']
 
-    def __init__(self, clusters_data):
-        self._clusters_data = clusters_data
+    def __init__(self, clusters_data=None, mode='heatmap', cell_size=0.001, df=None, hotspot=None, boundaries=None):
+        if mode not in self.MODES:
+            raise ValueError('Invalid mode: {0}'.format(mode))
+        self._mode = mode
+        self._cell_size = cell_size
         self.folium_map = folium.Map(location=(-23.5489, -46.6388), zoom_start=14)
-        circles, polygons = self._get_data()
+        if clusters_data is not None:
+            data = self._parse_clusters_data(clusters_data)
+        else:
+            data = self._parse_dataframe(df, hotspot, boundaries)
+        points, polygons = self._get_data(*data)
         self.folium_map.add_child(polygons)
-        self.folium_map.add_child(circles)
+        self.folium_map.add_child(points)
 
     def get_result(self):
         return self.folium_map
 
     def save_map_to(self, address):
-        with open(address, 'w') as f:
+        with open(address + '.tmp', 'w') as f:
             f.write(self.folium_map._repr_html_())
+        os.replace(address + '.tmp', address)
 
-    def _get_data(self):
-        circles = folium.FeatureGroup(name='Circles')
-        polygons = folium.FeatureGroup(name='Polygons')
-        for data in self._clusters_data:
+    def _parse_clusters_data(self, clusters_data):
+        locations = []
+        properties = []
+        boundaries = []
+        for data in clusters_data:
             features = data['features']
             for feature in features:
                 if feature['geometry']['type'] == 'Point':
-                    date = feature['properties']['date']
-                    time = feature['properties']['time']
-                    location = feature['geometry']['coordinates']
-                    circles.add_child(self._new_circle(date, time, location))
+                    locations.append(feature['geometry']['coordinates'])
+                    if self._mode == 'circles':
+                        properties.append((feature['properties']['date'], feature['properties']['time']))
                 elif feature['geometry']['type'] == 'LineString':
-                    hotspot = feature['hotspot']
-                    locations = feature['geometry']['coordinates']
-                    if locations:
-                        polygons.add_child(self._new_polygon(locations, hotspot))
+                    if feature['geometry']['coordinates']:
+                        boundaries.append((feature['geometry']['coordinates'], feature['hotspot']))
+        return np.asarray(locations, dtype='float64').reshape(-1, 2), properties, boundaries
+
+    def _parse_dataframe(self, df, hotspot, boundaries):
+        order = np.argsort(df['GRUPO'].to_numpy(), kind='stable')
+        locations = np.round(df[['LATITUDE', 'LONGITUDE']].to_numpy(dtype='float64')[order], 6)
+        properties = []
+        if self._mode == 'circles':
+            properties = list(zip(df['DATAOCORRENCIA'].to_numpy()[order].tolist(),
+                                  df['HORAOCORRENCIA'].to_numpy()[order].tolist()))
+        boundaries = [(boundaries.get(cluster, []), bool(hotspot[cluster])) for cluster in range(len(hotspot))]
+        return locations, properties, [boundary for boundary in boundaries if boundary[0]]
+
+    def _get_data(self, locations, properties, boundaries):
+        polygons = folium.FeatureGroup(name='Polygons')
+        for coordinates, hotspot in boundaries:
+            polygons.add_child(self._new_polygon(coordinates, hotspot))
+        if self._mode == 'heatmap':
+            return self._new_heatmap(locations), polygons
+        elif self._mode == 'cluster':
+            return self._new_marker_cluster(locations), polygons
+        circles = folium.FeatureGroup(name='Circles')
+        for location, (date, time) in zip(locations.tolist(), properties):
+            circles.add_child(self._new_circle(date, time, location))
         return circles, polygons
 
+    def _aggregate(self, locations):
+        cells, counts = np.unique(np.round(locations / self._cell_size), axis=0, return_counts=True)
+        return np.round(cells * self._cell_size, 6), counts
+
+    def _new_heatmap(self, locations):
+        cells, counts = self._aggregate(locations)
+        return HeatMap(
+            data=np.c_[cells, counts].tolist(),
+            name='Heatmap',
+            radius=15,
+            min_opacity=0.3
+        )
+
+    @staticmethod
+    def _new_marker_cluster(locations):
+        return FastMarkerCluster(
+            data=np.round(locations, 5).tolist(),
+            name='Clusters'
+        )
+
     @staticmethod
     def _new_circle(date, time, location):
         return folium.Circle(
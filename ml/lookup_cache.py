@@ -0,0 +1,56 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+
+
+class LookupCache(object):
+
+    def __init__(self, max_bytes=64 * 2 ** 20, ttl=1.0):
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self._active = None
+
+    def get_active(self, default=None):
+        active = self._active
+        if active is None or active[0] < time.monotonic():
+            return default
+        return active[1]
+
+    def set_active(self, pk):
+        self._active = (time.monotonic() + self._ttl, pk)
+
+    def get(self, run, cluster):
+        with self._lock:
+            entry = self._entries.get((run, cluster))
+            if entry is not None:
+                self._entries.move_to_end((run, cluster))
+            return entry
+
+    def put(self, run, cluster, etag, modified, content_gzip):
+        if len(content_gzip) > self._max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop((run, cluster), None)
+            if previous is not None:
+                self._size -= len(previous[2])
+            self._entries[(run, cluster)] = (etag, modified, content_gzip)
+            self._size += len(content_gzip)
+            while self._size > self._max_bytes:
+                _, entry = self._entries.popitem(last=False)
+                self._size -= len(entry[2])
+
+    def get_size(self):
+        return self._size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self._active = None
+
+
+lookup_cache = LookupCache(settings.ML_LOOKUP_CACHE_BYTES, settings.ML_ACTIVE_RUN_TTL)
@@ -0,0 +1,344 @@
+import http.client
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from urllib.parse import urlsplit
+import numpy as np
+import pandas as pd
+import sklearn
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from sklearn.cluster import MiniBatchKMeans
+from ml import dataframe_cache
+from ml import views
+from ml.centroid_index import CentroidIndex
+from ml.hotspot_predictor import HotspotPredictor
+from ml.model_registry import registry
+from ml.profiler import StageProfiler
+from ml.synthetic import write_ssp_file
+from ml.training import publish
+
+
+class Command(BaseCommand):
+    help = 'Mede o desempenho das etapas do modelo de hotspots'
+
+    def add_arguments(self, parser):
+        parser.add_argument('target', choices=['lookup', 'loading', 'memory', 'pipeline', 'load'])
+        parser.add_argument('--clusters', type=int, nargs='+', default=[500, 2000, 10000])
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--files', type=int, nargs='+', default=[1, 6, 12])
+        parser.add_argument('--rows', type=int, default=50000, help='Ocorrências por arquivo')
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--path', help='Arquivo da SSP usado no lugar de dados sintéticos')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000],
+                            help='Total de ocorrências em cada execução do pipeline')
+        parser.add_argument('--months', type=int, default=3, help='Arquivos mensais em cada execução do pipeline')
+        parser.add_argument('--output', help='Arquivo JSON com os resultados do pipeline ou do teste de carga')
+        parser.add_argument('--urls', nargs='+', help='Servidores já em execução no formato nome=url, usados no '
+                                                      'teste de carga no lugar dos servidores WSGI e ASGI locais')
+        parser.add_argument('--requests', type=int, default=2000, help='Requisições por servidor no teste de carga')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--batch-size', type=int, default=50, help='Coordenadas por requisição em lote')
+
+    def handle(self, *args, **options):
+        getattr(self, '_benchmark_' + options['target'])(options)
+
+    def _benchmark_lookup(self, options):
+        rng = np.random.default_rng(options['seed'])
+        queries = self._random_points(rng, options['queries'])
+        for n_clusters in options['clusters']:
+            kmeans = MiniBatchKMeans(n_clusters=n_clusters, init_size=n_clusters, max_iter=1, n_init=1)
+            kmeans.fit(self._random_points(rng, 2 * n_clusters))
+            index = CentroidIndex(kmeans.cluster_centers_)
+            predict = self._timeit(lambda point: kmeans.predict([point]), queries)
+            query = self._timeit(lambda point: index.query(point), queries)
+            centers = kmeans.cluster_centers_
+            agreement = np.mean(np.all(centers[kmeans.predict(queries)] == centers[index.query(queries)], axis=1))
+            self.stdout.write(
+                'k={0:>6} | kmeans.predict mean={1:8.3f}ms p99={2:8.3f}ms | '
+                'CentroidIndex.query mean={3:8.3f}ms p99={4:8.3f}ms | concordancia={5:.4f}'.format(
+                    n_clusters, predict.mean(), np.percentile(predict, 99), query.mean(), np.percentile(query, 99),
+                    agreement))
+
+    def _benchmark_loading(self, options):
+        directory = tempfile.mkdtemp()
+        try:
+            filepaths = [write_ssp_file(os.path.join(directory, '{0}.xls'.format(month)), options['rows'],
+                                        month=month, seed=options['seed'] + month)
+                         for month in range(1, max(options['files']) + 1)]
+            for n_files in options['files']:
+                selected = filepaths[:n_files]
+                sequential = self._time_loading(selected, 1)
+                parallel = self._time_loading(selected, options['workers'])
+                start = time.perf_counter()
+                HotspotPredictor.load_dataframe(selected)
+                cached = time.perf_counter() - start
+                self.stdout.write(
+                    'arquivos={0:>3} | sequencial={1:8.3f}s | paralelo ({2} processos)={3:8.3f}s | '
+                    'cache={4:8.3f}s'.format(n_files, sequential, options['workers'], parallel, cached))
+        finally:
+            shutil.rmtree(directory)
+
+    def _benchmark_memory(self, options):
+        directory = tempfile.mkdtemp()
+        try:
+            filepath = options['path'] or write_ssp_file(os.path.join(directory, '1.xls'), options['rows'],
+                                                         seed=options['seed'])
+            cols = ['DATAOCORRENCIA', 'HORAOCORRENCIA', 'BAIRRO', 'CIDADE', 'LATITUDE', 'LONGITUDE']
+            df = pd.read_csv(filepath, encoding='utf-16 le', delimiter='\t', decimal=',', usecols=cols,
+                             dtype={col: object for col in HotspotPredictor.CATEGORY_COLUMNS})
+            df.drop_duplicates(inplace=True)
+            df['LATITUDE'] = pd.to_numeric(df['LATITUDE'], errors='coerce')
+            df['LONGITUDE'] = pd.to_numeric(df['LONGITUDE'], errors='coerce')
+            df.dropna(inplace=True)
+            df['MES'] = 1
+            compact = HotspotPredictor.load_dataframe([filepath])
+            dataframe_cache.remove(filepath)
+            self.stdout.write('linhas={0} | original={1:.2f}MB | compacto={2:.2f}MB'.format(
+                len(compact), df.memory_usage(deep=True).sum() / 2 ** 20,
+                compact.memory_usage(deep=True).sum() / 2 ** 20))
+            for col in compact.columns:
+                self.stdout.write('  {0:<16} {1:<10} {2:>10.2f}MB -> {3:<16} {4:>10.2f}MB'.format(
+                    col, str(df[col].dtype) if col in df else '-',
+                    df[col].memory_usage(deep=True, index=False) / 2 ** 20 if col in df else 0,
+                    str(compact[col].dtype), compact[col].memory_usage(deep=True, index=False) / 2 ** 20))
+        finally:
+            shutil.rmtree(directory)
+
+    def _benchmark_pipeline(self, options):
+        directory = tempfile.mkdtemp()
+        results = []
+        try:
+            with override_settings(MEDIA_ROOT=directory):
+                for n_rows in options['sizes']:
+                    filepaths = [write_ssp_file(os.path.join(directory, '{0}.xls'.format(month)),
+                                                n_rows // options['months'], month=month,
+                                                seed=options['seed'] + month)
+                                 for month in range(1, options['months'] + 1)]
+                    for n_clusters in options['clusters']:
+                        if n_clusters >= n_rows // options['months']:
+                            self.stdout.write('n={0} k={1} ignorado: agrupamentos demais'.format(n_rows, n_clusters))
+                            continue
+                        result = self._run_pipeline(filepaths, n_clusters, options)
+                        results.append(result)
+                        self._write_pipeline(result)
+        finally:
+            registry.invalidate()
+            shutil.rmtree(directory)
+        report = {'environment': self._get_environment(), 'results': results}
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+        return report
+
+    def _run_pipeline(self, filepaths, n_clusters, options):
+        for filepath in filepaths:
+            dataframe_cache.remove(filepath)
+        profiler = StageProfiler()
+        predictor = HotspotPredictor(filepaths=filepaths, n_clusters=n_clusters,
+                                     progress=lambda stage, progress: profiler.start(stage))
+        n_rows = len(predictor.get_df())
+        for stage in ['dataframe', 'kmeans']:
+            profiler.set_rows(stage, n_rows)
+        profiler.set_rows('hotspot', len(predictor.get_counts()))
+        profiler.set_rows('boundaries', n_clusters)
+        with transaction.atomic():
+            publish(predictor, profiler=profiler)
+            registry.invalidate()
+            factory = RequestFactory()
+            queries = self._random_points(np.random.default_rng(options['seed']), options['queries'])
+            timings = self._timeit(lambda point: self._request_api(factory, point), queries)
+            transaction.set_rollback(True)
+        return {
+            'rows': n_rows,
+            'clusters': n_clusters,
+            'months': len(filepaths),
+            'stages': profiler.get_stages(),
+            'total': profiler.get_total(),
+            'api': {
+                'queries': len(timings),
+                'mean_ms': timings.mean(),
+                'p50_ms': np.percentile(timings, 50),
+                'p99_ms': np.percentile(timings, 99)
+            }
+        }
+
+    def _write_pipeline(self, result):
+        self.stdout.write('n={0} k={1} | total={2:.3f}s | api mean={3:.3f}ms p99={4:.3f}ms'.format(
+            result['rows'], result['clusters'], result['total']['wall_time'], result['api']['mean_ms'],
+            result['api']['p99_ms']))
+        for stage in result['stages']:
+            self.stdout.write('  {0:<12} {1:>10.3f}s {2:>10.3f}s cpu {3:>10.1f}MB'.format(
+                stage['stage'], stage['wall_time'], stage['cpu_time'], stage['peak_rss'] / 2 ** 20))
+
+    def _benchmark_load(self, options):
+        servers = dict(url.split('=', 1) for url in options['urls'] or [])
+        processes = []
+        try:
+            if not servers:
+                for name, command in self._get_server_commands(options['workers']).items():
+                    port = self._get_free_port()
+                    processes.append(self._start_server(command, port, name == 'asgi'))
+                    servers[name] = 'http://127.0.0.1:{0}'.format(port)
+                for process, url in zip(processes, servers.values()):
+                    self._wait_server(process, url)
+            rng = np.random.default_rng(options['seed'])
+            queries = self._random_points(rng, options['requests'])
+            results = []
+            for name, url in servers.items():
+                result = dict(self._run_load(url, queries, options), server=name, url=url)
+                results.append(result)
+                self.stdout.write('{0:<6} {1:>9.1f} req/s | mean={2:8.3f}ms p50={3:8.3f}ms p99={4:8.3f}ms '
+                                  'max={5:8.3f}ms | erros={6}'.format(
+                                      name, result['rps'], result['mean_ms'], result['p50_ms'], result['p99_ms'],
+                                      result['max_ms'], result['errors']))
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+        report = {'environment': self._get_environment(), 'requests': options['requests'],
+                  'concurrency': options['concurrency'], 'batch_size': options['batch_size'], 'results': results}
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+        return report
+
+    def _run_load(self, url, queries, options):
+        address = urlsplit(url)
+        prefix = address.path.rstrip('/')
+        api, api_batch = prefix + reverse('ml:api'), prefix + reverse('ml:api_batch')
+        local = threading.local()
+
+        def request(idx):
+            if getattr(local, 'connection', None) is None:
+                local.connection = http.client.HTTPConnection(address.hostname, address.port, timeout=30)
+            start = time.perf_counter()
+            try:
+                if idx % 10 == 9:
+                    points = queries[idx:idx + options['batch_size']].tolist()
+                    local.connection.request('POST', api_batch, json.dumps(points),
+                                             {'Content-Type': 'application/json'})
+                else:
+                    local.connection.request('GET', api + '?' + urlencode({'latitude': queries[idx][0],
+                                                                           'longitude': queries[idx][1]}))
+                response = local.connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                local.connection.close()
+                local.connection = None
+                status = 0
+            return (time.perf_counter() - start) * 1000, status
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            list(executor.map(request, range(min(2 * options['concurrency'], len(queries)))))
+            start = time.perf_counter()
+            responses = list(executor.map(request, range(len(queries))))
+            elapsed = time.perf_counter() - start
+        timings = np.array([timing for timing, _ in responses])
+        return {
+            'requests': len(responses),
+            'errors': sum(1 for _, status in responses if status != 200),
+            'rps': len(responses) / elapsed,
+            'mean_ms': timings.mean(),
+            'p50_ms': np.percentile(timings, 50),
+            'p95_ms': np.percentile(timings, 95),
+            'p99_ms': np.percentile(timings, 99),
+            'max_ms': timings.max()
+        }
+
+    @staticmethod
+    def _get_server_commands(workers):
+        return {
+            'wsgi': [sys.executable, '-m', 'gunicorn', 'server.wsgi:application', '--worker-class', 'gthread',
+                     '--threads', '4', '--workers', str(workers), '--bind', '127.0.0.1:{port}'],
+            'asgi': [sys.executable, '-m', 'uvicorn', 'server.asgi:application', '--workers', str(workers),
+                     '--host', '127.0.0.1', '--port', '{port}', '--no-access-log']
+        }
+
+    @staticmethod
+    def _start_server(command, port, asynchronous):
+        env = dict(os.environ, ML_ASYNC_API=str(int(asynchronous)),
+                   DJANGO_ALLOWED_HOSTS=' '.join(settings.ALLOWED_HOSTS + ['127.0.0.1']))
+        return subprocess.Popen([arg.format(port=port) for arg in command], cwd=settings.BASE_DIR, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    @staticmethod
+    def _wait_server(process, url, timeout=60):
+        address = urlsplit(url)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError('Servidor encerrado com código {0}'.format(process.returncode))
+            try:
+                socket.create_connection((address.hostname, address.port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError('Servidor não respondeu em {0}s'.format(timeout))
+
+    @staticmethod
+    def _get_free_port():
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    @staticmethod
+    def _request_api(factory, point):
+        response = views.api(factory.get('/api', {'latitude': point[0], 'longitude': point[1]}))
+        if response.status_code != 200:
+            raise RuntimeError('Consulta retornou {0}'.format(response.status_code))
+
+    @staticmethod
+    def _get_environment():
+        try:
+            commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, universal_newlines=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'sklearn': sklearn.__version__,
+            'cpu_count': os.cpu_count(),
+            'map_mode': settings.ML_MAP_MODE
+        }
+
+    @staticmethod
+    def _time_loading(filepaths, n_jobs):
+        for filepath in filepaths:
+            dataframe_cache.remove(filepath)
+        start = time.perf_counter()
+        HotspotPredictor.load_dataframe(filepaths, n_jobs)
+        return time.perf_counter() - start
+
+    @staticmethod
+    def _random_points(rng, size):
+        return np.c_[rng.uniform(-24.0, -23.3, size), rng.uniform(-47.0, -46.3, size)]
+
+    @staticmethod
+    def _timeit(function, points):
+        timings = np.empty(len(points))
+        for idx, point in enumerate(points):
+            start = time.perf_counter()
+            function(point)
+            timings[idx] = (time.perf_counter() - start) * 1000
+        return timings
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from ml.models import TrainingRun
+from ml.training import activate_run
+from ml.training import collect_runs
+from ml.training import convert_index
+from ml.training import rollback_run
+
+
+class Command(BaseCommand):
+    help = 'Lista, ativa, reverte, remove e converte as execuções de treinamento publicadas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['list', 'activate', 'rollback', 'collect', 'convert'])
+        parser.add_argument('run', type=int, nargs='?')
+        parser.add_argument('--keep', type=int, default=settings.ML_TRAINING_RUNS_KEEP)
+
+    def handle(self, *args, **options):
+        getattr(self, '_' + options['action'])(options)
+
+    def _list(self, options):
+        for run in TrainingRun.objects.order_by('-created_at'):
+            self.stdout.write('{0:>6} {1:<6} treinamento={2} criada={3:%Y-%m-%d %H:%M} ativada={4}'.format(
+                run.pk, 'ativa' if run.active else '', run.job_id, run.created_at,
+                '{0:%Y-%m-%d %H:%M}'.format(run.activated_at) if run.activated_at else '-'))
+
+    def _activate(self, options):
+        run = TrainingRun.objects.filter(pk=options['run'], activated_at__isnull=False).first()
+        if run is None:
+            raise CommandError('Execução {0} não encontrada ou nunca publicada'.format(options['run']))
+        activate_run(run)
+        self.stdout.write('Execução {0} ativada'.format(run.pk))
+
+    def _rollback(self, options):
+        run = rollback_run()
+        if run is None:
+            raise CommandError('Nenhuma execução anterior disponível')
+        self.stdout.write('Execução {0} ativada'.format(run.pk))
+
+    def _collect(self, options):
+        runs = collect_runs(options['keep'])
+        self.stdout.write('{0} execuções removidas'.format(len(runs)))
+
+    def _convert(self, options):
+        converted = 0
+        for run in [None] + list(TrainingRun.objects.order_by('pk').values_list('pk', flat=True)):
+            try:
+                converted += convert_index(run)
+            except FileNotFoundError:
+                continue
+        self.stdout.write('{0} índices convertidos'.format(converted))
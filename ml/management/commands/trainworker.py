@@ -0,0 +1,62 @@
+import multiprocessing
+import os
+import socket
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from ml.models import TrainingJob
+from ml.training import claim_job
+from ml.training import finish_job
+from ml.training import recover_jobs
+from ml.training import renew_jobs
+from ml.training import run_job
+
+
+def run_job_by_pk(pk):
+    try:
+        run_job(TrainingJob.objects.get(pk=pk))
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Executa os treinamentos pendentes em processos separados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.ML_TRAINING_WORKERS)
+        parser.add_argument('--poll', type=float, default=settings.ML_TRAINING_POLL)
+        parser.add_argument('--once', action='store_true', help='Encerra quando não houver treinamentos pendentes')
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('fork')
+        worker = '{0}:{1}'.format(socket.gethostname(), os.getpid())
+        running = {}
+        while True:
+            self._reap(running)
+            renew_jobs(list(running))
+            for job in recover_jobs():
+                self.stdout.write('Treinamento {0} interrompido marcado como falho'.format(job.pk))
+            while len(running) < options['workers']:
+                job = claim_job(worker)
+                if job is None:
+                    break
+                connections.close_all()
+                process = context.Process(target=run_job_by_pk, args=(job.pk,))
+                process.start()
+                running[job.pk] = process
+                self.stdout.write('Treinamento {0} iniciado (pid {1})'.format(job.pk, process.pid))
+            if options['once'] and not running:
+                return
+            time.sleep(options['poll'])
+
+    def _reap(self, running):
+        for pk, process in list(running.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            del running[pk]
+            job = TrainingJob.objects.get(pk=pk)
+            if not job.is_finished():
+                finish_job(job, TrainingJob.FAILED, 'Processo encerrado com código {0}'.format(process.exitcode))
+            self.stdout.write('Treinamento {0} finalizado: {1}'.format(pk, job.get_status_display()))
@@ -0,0 +1,39 @@
+# Generated by Django 3.1.12 on 2026-10-18 12:00
+
+from django.db import migrations, models
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Cast
+
+
+def backfill_cluster_hotspot(apps, schema_editor):
+    ClusterData = apps.get_model('ml', 'ClusterData')
+    ClusterData.objects.update(
+        cluster=Cast(KeyTextTransform('cluster', 'data'), models.IntegerField()),
+        hotspot=Cast(KeyTextTransform('hotspot', 'data'), models.BooleanField())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clusterdata',
+            name='cluster',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='clusterdata',
+            name='hotspot',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(backfill_cluster_hotspot, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='clusterdata',
+            name='cluster',
+            field=models.IntegerField(unique=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.12 on 2026-10-18 09:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml', '0002_clusterdata_cluster_hotspot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrainingJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filepaths', models.JSONField()),
+                ('n_clusters', models.IntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pendente'), ('running', 'Em execução'), ('success', 'Concluído'), ('failed', 'Falhou')], db_index=True, default='pending', max_length=16)),
+                ('stage', models.CharField(blank=True, max_length=32)),
+                ('progress', models.FloatField(default=0.0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.12 on 2026-10-18 09:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml', '0003_trainingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingjob',
+            name='metadata',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
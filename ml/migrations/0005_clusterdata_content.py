@@ -0,0 +1,50 @@
+# Generated by Django 3.1.12 on 2026-10-18 10:01
+
+import gzip
+import json
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def serialize_content(apps, schema_editor):
+    ClusterData = apps.get_model('ml', 'ClusterData')
+    objs = []
+    for obj in ClusterData.objects.iterator(chunk_size=100):
+        obj.content = json.dumps(obj.data, separators=(',', ':')).encode()
+        obj.content_gzip = gzip.compress(obj.content)
+        objs.append(obj)
+        if len(objs) == 100:
+            ClusterData.objects.bulk_update(objs, ['content', 'content_gzip'])
+            objs = []
+    ClusterData.objects.bulk_update(objs, ['content', 'content_gzip'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml', '0004_trainingjob_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clusterdata',
+            name='content',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.AddField(
+            model_name='clusterdata',
+            name='content_gzip',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.AddField(
+            model_name='clusterdata',
+            name='modified',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='clusterdata',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(serialize_content, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.12 on 2026-10-18 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml', '0005_clusterdata_content'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingjob',
+            name='incremental',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.1.12 on 2026-10-18 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml', '0006_trainingjob_incremental'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClusterMonthCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cluster', models.IntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('count', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='clustermonthcount',
+            index=models.Index(fields=['month'], name='clustermonthcount_month_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='clustermonthcount',
+            constraint=models.UniqueConstraint(fields=('cluster', 'month'), name='unique_cluster_month'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.12 on 2026-10-18 10:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml', '0007_clustermonthcount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingjob',
+            name='min_clusters',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trainingjob',
+            name='sweep',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.1.12 on 2026-10-18 10:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml', '0008_trainingjob_sweep'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Release',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('active', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('activated_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='clusterdata',
+            name='release',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='clusterdata',
+            name='cluster',
+            field=models.IntegerField(),
+        ),
+        migrations.AddConstraint(
+            model_name='clusterdata',
+            constraint=models.UniqueConstraint(fields=('release', 'cluster'), name='unique_release_cluster'),
+        ),
+        migrations.AddField(
+            model_name='release',
+            name='job',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='ml.trainingjob'),
+        ),
+        migrations.AddConstraint(
+            model_name='release',
+            constraint=models.UniqueConstraint(condition=models.Q(active=True), fields=('active',), name='single_active_release'),
+        ),
+    ]
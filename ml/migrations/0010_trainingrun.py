@@ -0,0 +1,51 @@
+# Generated by Django 3.1.12 on 2026-10-18 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml', '0009_release'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='clusterdata',
+            name='unique_release_cluster',
+        ),
+        migrations.RemoveConstraint(
+            model_name='release',
+            name='single_active_release',
+        ),
+        migrations.RemoveConstraint(
+            model_name='clustermonthcount',
+            name='unique_cluster_month',
+        ),
+        migrations.RenameModel(
+            old_name='Release',
+            new_name='TrainingRun',
+        ),
+        migrations.RenameField(
+            model_name='clusterdata',
+            old_name='release',
+            new_name='run',
+        ),
+        migrations.AddField(
+            model_name='clustermonthcount',
+            name='run',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='clusterdata',
+            constraint=models.UniqueConstraint(fields=('run', 'cluster'), name='unique_run_cluster'),
+        ),
+        migrations.AddConstraint(
+            model_name='trainingrun',
+            constraint=models.UniqueConstraint(condition=models.Q(active=True), fields=('active',), name='single_active_run'),
+        ),
+        migrations.AddConstraint(
+            model_name='clustermonthcount',
+            constraint=models.UniqueConstraint(fields=('run', 'cluster', 'month'), name='unique_run_cluster_month'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.12 on 2026-10-18 10:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml', '0010_trainingrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trainingjob',
+            name='worker',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
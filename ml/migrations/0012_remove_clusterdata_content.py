@@ -0,0 +1,17 @@
+# Generated by Django 3.1.12 on 2026-10-18 10:52
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml', '0011_trainingjob_worker'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='clusterdata',
+            name='content',
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.1.12 on 2026-10-18 10:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def clear_legacy_runs(apps, schema_editor):
+    runs = apps.get_model('ml', 'TrainingRun').objects.values_list('pk', flat=True)
+    for name in ['ClusterData', 'ClusterMonthCount']:
+        model = apps.get_model('ml', name)
+        model.objects.filter(run=0).update(run=None)
+        model.objects.exclude(run__isnull=True).exclude(run__in=runs).delete()
+
+
+def restore_legacy_runs(apps, schema_editor):
+    for name in ['ClusterData', 'ClusterMonthCount']:
+        apps.get_model('ml', name).objects.filter(run__isnull=True).update(run=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml', '0012_remove_clusterdata_content'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='clusterdata',
+            name='run',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='clustermonthcount',
+            name='run',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.RunPython(clear_legacy_runs, restore_legacy_runs),
+        migrations.AlterField(
+            model_name='clusterdata',
+            name='run',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='ml.trainingrun'),
+        ),
+        migrations.AlterField(
+            model_name='clustermonthcount',
+            name='run',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='ml.trainingrun'),
+        ),
+    ]
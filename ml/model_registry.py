@@ -0,0 +1,74 @@
+import os
+import threading
+from collections import OrderedDict
+from django.db import DatabaseError
+from joblib import load
+from ml.centroid_index import CentroidIndex
+from ml.hotspot_cube import HotspotCube
+
+
+class ModelRegistry(object):
+
+    def __init__(self, loader=None, max_entries=8):
+        self._loader = loader or load_artifact
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, address):
+        version = self._get_version(address)
+        with self._lock:
+            entry = self._entries.get(address)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(address)
+                return entry[1]
+        with self._lock:
+            entry = self._entries.get(address)
+            if entry is None or entry[0] != version:
+                entry = (version, self._loader(address))
+                self._entries.pop(address, None)
+                self._entries[address] = entry
+                while len(self._entries) > self._max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(address)
+            return entry[1]
+
+    def warm(self, *addresses):
+        for address in addresses:
+            try:
+                self.get(address)
+            except FileNotFoundError:
+                pass
+
+    def warm_active(self):
+        from ml.models import TrainingRun
+        try:
+            self.warm(TrainingRun.get_path(TrainingRun.get_active_pk(), 'index.json'))
+        except DatabaseError:
+            pass
+
+    def invalidate(self, address=None):
+        with self._lock:
+            if address is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(address, None)
+
+    @staticmethod
+    def _get_version(address):
+        stat = os.stat(address)
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+LOADERS = {
+    'index.json': CentroidIndex.load,
+    'cube.json': HotspotCube.load
+}
+
+
+def load_artifact(address):
+    return LOADERS.get(os.path.basename(address), load)(address)
+
+
+registry = ModelRegistry()
@@ -1,4 +1,13 @@
+import csv
+import gzip
+import io
+import json
+import pandas as pd
+from django.conf import settings
+from django.db import connection
 from django.db import models
+from django.db import transaction
+from django.utils import timezone
 
 
 class UploadFile(models.Model):
@@ -8,5 +17,195 @@ class UploadFile(models.Model):
         return self.file.name
 
 
+class TrainingRun(models.Model):
+    job = models.ForeignKey('TrainingJob', null=True, blank=True, on_delete=models.SET_NULL)
+    active = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    activated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['active'], condition=models.Q(active=True), name='single_active_run')
+        ]
+
+    def __str__(self):
+        return 'Execução {0}'.format(self.pk)
+
+    @classmethod
+    def get_active_pk(cls):
+        return cls.objects.filter(active=True).values_list('pk', flat=True).first()
+
+    @staticmethod
+    def get_path(pk, name):
+        if pk:
+            return '{0}/runs/{1}/{2}'.format(settings.MEDIA_ROOT, pk, name)
+        return settings.MEDIA_ROOT + '/' + name
+
+    def get_directory(self):
+        return '{0}/runs/{1}'.format(settings.MEDIA_ROOT, self.pk)
+
+    def activate(self):
+        with transaction.atomic():
+            previous = TrainingRun.objects.select_for_update().filter(active=True).exclude(pk=self.pk).first()
+            if previous is not None:
+                previous.active = False
+                previous.save(update_fields=['active'])
+            self.active = True
+            self.activated_at = timezone.now()
+            self.save(update_fields=['active', 'activated_at'])
+        return previous.pk if previous is not None else None
+
+    def to_dict(self):
+        return {
+            'id': self.pk,
+            'job': self.job_id,
+            'active': self.active,
+            'created_at': self.created_at,
+            'activated_at': self.activated_at
+        }
+
+
+def copy_run(model, source, target):
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(quote_name(field.column) for field in model._meta.concrete_fields
+                        if not field.primary_key and field.name != 'run')
+    condition = 'IS NULL' if source is None else '= %s'
+    with connection.cursor() as cursor:
+        cursor.execute('INSERT INTO {0} ({1}, {2}) SELECT {1}, %s FROM {0} WHERE {2} {3}'.format(
+            quote_name(model._meta.db_table), columns, quote_name(model._meta.get_field('run').column), condition),
+            [target] if source is None else [target, source])
+
+
 class ClusterData(models.Model):
+    COPY_COLUMNS = ['cluster', 'hotspot', 'data', 'content_gzip', 'version', 'run_id', 'modified']
+
+    cluster = models.IntegerField()
+    hotspot = models.BooleanField(default=False)
     data = models.JSONField()
+    content_gzip = models.BinaryField(default=b'')
+    version = models.PositiveIntegerField(default=0)
+    run = models.ForeignKey(TrainingRun, null=True, on_delete=models.CASCADE, db_index=False)
+    modified = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'cluster'], name='unique_run_cluster')
+        ]
+
+    def get_etag(self):
+        return '"{0}-{1}"'.format(self.version, self.cluster)
+
+    def set_data(self, data):
+        self.data = data
+        self.cluster = data['cluster']
+        self.hotspot = data['hotspot']
+        self.content_gzip = gzip.compress(json.dumps(data, separators=(',', ':')).encode())
+
+    @classmethod
+    def save_batch(cls, objs):
+        if not objs:
+            return
+        if connection.vendor != 'postgresql':
+            cls.objects.bulk_create(objs)
+            return
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for obj in objs:
+            writer.writerow([obj.cluster, obj.hotspot, json.dumps(obj.data, separators=(',', ':')),
+                             '\\x' + bytes(obj.content_gzip).hex(), obj.version, obj.run_id, obj.modified.isoformat()])
+        buffer.seek(0)
+        quote_name = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.copy_expert('COPY {0} ({1}) FROM STDIN WITH (FORMAT csv)'.format(
+                quote_name(cls._meta.db_table), ', '.join(map(quote_name, cls.COPY_COLUMNS))), buffer)
+
+
+class ClusterMonthCount(models.Model):
+    cluster = models.IntegerField()
+    month = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField()
+    run = models.ForeignKey(TrainingRun, null=True, on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'cluster', 'month'], name='unique_run_cluster_month')
+        ]
+        indexes = [
+            models.Index(fields=['month'], name='clustermonthcount_month_idx')
+        ]
+
+    @classmethod
+    def get_table(cls, queryset=None):
+        if queryset is None:
+            queryset = cls.objects.filter(run=TrainingRun.get_active_pk())
+        rows = list(queryset.values_list('cluster', 'month', 'count'))
+        return pd.DataFrame.from_records(rows, columns=['GRUPO', 'MES', 'COUNT'])
+
+    @classmethod
+    def save_table(cls, counts, run=None):
+        objs = [cls(cluster=cluster, month=month, count=count, run_id=run) for cluster, month, count in
+                zip(counts['GRUPO'].tolist(), counts['MES'].tolist(), counts['COUNT'].tolist())]
+        cls.objects.bulk_create(objs, batch_size=1000)
+
+
+class TrainingJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCESS = 'success'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pendente'),
+        (RUNNING, 'Em execução'),
+        (SUCCESS, 'Concluído'),
+        (FAILED, 'Falhou'),
+    ]
+
+    filepaths = models.JSONField()
+    n_clusters = models.IntegerField()
+    incremental = models.BooleanField(default=False)
+    sweep = models.BooleanField(default=False)
+    min_clusters = models.IntegerField(null=True, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    stage = models.CharField(max_length=32, blank=True)
+    progress = models.FloatField(default=0.0)
+    error = models.TextField(blank=True)
+    metadata = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=255, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return 'Treinamento {0} ({1})'.format(self.pk, self.get_status_display())
+
+    def is_finished(self):
+        return self.status in (self.SUCCESS, self.FAILED)
+
+    def get_duration(self):
+        if self.started_at is None:
+            return None
+        end = self.finished_at or timezone.now()
+        return (end - self.started_at).total_seconds()
+
+    def to_dict(self):
+        return {
+            'id': self.pk,
+            'status': self.status,
+            'status_display': self.get_status_display(),
+            'stage': self.stage,
+            'progress': self.progress,
+            'error': self.error,
+            'metadata': self.metadata,
+            'n_clusters': self.n_clusters,
+            'incremental': self.incremental,
+            'sweep': self.sweep,
+            'min_clusters': self.min_clusters,
+            'n_files': len(self.filepaths),
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'worker': self.worker,
+            'duration': self.get_duration(),
+            'finished': self.is_finished()
+        }
@@ -0,0 +1,64 @@
+import cProfile
+import os
+import resource
+import time
+
+
+def get_peak_rss():
+    return {
+        'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        'peak_rss_children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+    }
+
+
+def get_cpu_time():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class StageProfiler(object):
+
+    def __init__(self, cprofile=False):
+        self._stages = []
+        self._current = None
+        self._profile = cProfile.Profile() if cprofile else None
+        if self._profile is not None:
+            self._profile.enable()
+
+    def start(self, stage, rows=None):
+        self.stop()
+        self._current = {'stage': stage, 'rows': rows}, time.perf_counter(), get_cpu_time(), get_peak_rss()
+
+    def stop(self):
+        if self._current is None:
+            return
+        record, wall_time, cpu_time, peak_rss = self._current
+        current_rss = get_peak_rss()
+        record.update(current_rss, wall_time=time.perf_counter() - wall_time, cpu_time=get_cpu_time() - cpu_time,
+                      peak_rss_increase=current_rss['peak_rss'] - peak_rss['peak_rss'])
+        self._stages.append(record)
+        self._current = None
+
+    def set_rows(self, stage, rows):
+        records = self._stages + ([self._current[0]] if self._current is not None else [])
+        for record in records:
+            if record['stage'] == stage:
+                record['rows'] = rows
+
+    def get_stages(self):
+        return self._stages
+
+    def get_total(self):
+        return {
+            'wall_time': sum(record['wall_time'] for record in self._stages),
+            'cpu_time': sum(record['cpu_time'] for record in self._stages)
+        }
+
+    def dump_to(self, address):
+        if self._profile is None:
+            return False
+        self._profile.disable()
+        os.makedirs(os.path.dirname(address), exist_ok=True)
+        self._profile.dump_stats(address + '.tmp')
+        os.replace(address + '.tmp', address)
+        return True
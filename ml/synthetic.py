@@ -0,0 +1,28 @@
+import calendar
+import numpy as np
+
+COLUMNS = ['ANO_BO', 'NUM_BO', 'DATAOCORRENCIA', 'HORAOCORRENCIA', 'BAIRRO', 'CIDADE', 'LATITUDE', 'LONGITUDE']
+
+
+def write_ssp_file(address, n_rows, year=2020, month=1, n_hotspots=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = np.c_[rng.uniform(-23.75, -23.45, n_hotspots), rng.uniform(-46.80, -46.40, n_hotspots)]
+    hotspots = rng.integers(0, n_hotspots, n_rows)
+    coordinates = centers[hotspots] + rng.normal(scale=0.01, size=(n_rows, 2))
+    days = rng.integers(1, calendar.monthrange(year, month)[1] + 1, n_rows)
+    hours = rng.integers(0, 24, n_rows)
+    minutes = rng.integers(0, 60, n_rows)
+    with open(address, 'w', encoding='utf-16 le') as f:
+        f.write('\t'.join(COLUMNS) + '\n')
+        for idx in range(n_rows):
+            f.write('\t'.join([
+                str(year),
+                str(idx),
+                '{0:02d}/{1:02d}/{2}'.format(days[idx], month, year),
+                '{0:02d}:{1:02d}'.format(hours[idx], minutes[idx]),
+                'BAIRRO {0}'.format(hotspots[idx]),
+                'S.PAULO',
+                '{0:.8f}'.format(coordinates[idx, 0]).replace('.', ','),
+                '{0:.8f}'.format(coordinates[idx, 1]).replace('.', ',')
+            ]) + '\n')
+    return address
@@ -1,10 +1,59 @@
-from django.test import TestCase, Client
+import gzip
+import io
+import json
+import os
+import pstats
+import shutil
+import tempfile
+from datetime import datetime
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from asgiref.sync import async_to_sync
+from django.apps import apps
+from django.core.management import call_command
+from django.test import TestCase, Client, AsyncRequestFactory, LiveServerTestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth.models import User
+from django.db.models import Sum
 from django.core.files.uploadedfile import SimpleUploadedFile
+from scipy.spatial import Voronoi
+from joblib import dump
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.compose import ColumnTransformer
+from sklearn.linear_model import LinearRegression
+from sklearn.preprocessing import OneHotEncoder
 from .models import UploadFile
 from .forms import ChoiceFileForm
 from .forms import UploadFileForm
+from .models import ClusterData
+from .models import TrainingJob
+from .models import ClusterMonthCount
+from .models import TrainingRun
+from .models import copy_run
+from .training import claim_job
+from .training import collect_runs
+from .training import finish_job
+from .training import recover_jobs
+from .training import renew_jobs
+from .training import rollback_run
+from .training import run_job
+from .training import save_results
+from .synthetic import write_ssp_file
+from .hotspot_cube import HotspotCube
+from .hotspot_predictor import HotspotPredictor
+from .hotspot_viewer import HotspotViewer
+from . import dataframe_cache
+from . import voronoi
+from .model_registry import ModelRegistry
+from .model_registry import registry
+from .lookup_cache import LookupCache
+from .lookup_cache import lookup_cache
+from . import views
+from .centroid_index import CentroidIndex
+from .cluster_sweep import ClusterSweep
+from .viewport_index import ViewportIndex
 
 
 def create_uploaded_file():
@@ -158,6 +207,46 @@ class DeleteViewTests(TestCase):
 
 class TrainViewTests(TestCase):
 
+    def setUp(self):
+        self.filepaths = [UploadFile.objects.create(file=name).file.path for name in ['a.xls', 'b.xls']]
+
+    def test_post_creates_job(self):
+        client = Client()
+        client.force_login(User.objects.get_or_create(username='test_user')[0])
+        response = client.post(
+            path=reverse('ml:train'),
+            data={'filepath': self.filepaths, 'n_clusters': 10},
+            follow=True
+        )
+        job = TrainingJob.objects.get()
+        self.assertRedirects(
+            response=response,
+            expected_url=reverse('ml:job', args=[job.pk]),
+            status_code=302,
+            target_status_code=200
+        )
+        self.assertEqual(job.status, TrainingJob.PENDING)
+        self.assertFalse(job.sweep)
+        self.assertEqual(job.filepaths, self.filepaths)
+        self.assertTemplateUsed(response, template_name='ml/job.html')
+
+    def test_post_rejects_unknown_file(self):
+        client = Client()
+        client.force_login(User.objects.get_or_create(username='test_user')[0])
+        response = client.post(path=reverse('ml:train'),
+                               data={'filepath': [self.filepaths[0], '/tmp/a.xls'], 'n_clusters': 10})
+        self.assertRedirects(response, reverse('ml:index'), fetch_redirect_response=False)
+        self.assertFalse(TrainingJob.objects.exists())
+
+    def test_post_creates_sweep_job(self):
+        client = Client()
+        client.force_login(User.objects.get_or_create(username='test_user')[0])
+        client.post(path=reverse('ml:train'),
+                    data={'filepath': self.filepaths[:1], 'n_clusters': 500, 'sweep': 'on', 'min_clusters': 50})
+        job = TrainingJob.objects.get()
+        self.assertTrue(job.sweep)
+        self.assertEqual(job.min_clusters, 50)
+
     def test_get_redirection(self):
         client = Client()
         client.force_login(User.objects.get_or_create(username='test_user')[0])
@@ -171,3 +260,1066 @@ class TrainViewTests(TestCase):
             status_code=302,
             target_status_code=200
         )
+
+
+class ModelRegistryTests(TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.registry = ModelRegistry(loader=self.loader)
+        self.address = tempfile.mkstemp()[1]
+
+    def tearDown(self):
+        os.remove(self.address)
+
+    def loader(self, address):
+        self.calls.append(address)
+        with open(address) as f:
+            return f.read()
+
+    def test_load_once(self):
+        self.assertEqual(self.registry.get(self.address), '')
+        self.assertEqual(self.registry.get(self.address), '')
+        self.assertEqual(len(self.calls), 1)
+
+    def test_reload_on_change(self):
+        self.registry.get(self.address)
+        with open(self.address, 'w') as f:
+            f.write('new model')
+        self.assertEqual(self.registry.get(self.address), 'new model')
+        self.assertEqual(len(self.calls), 2)
+
+    def test_invalidate(self):
+        self.registry.get(self.address)
+        self.registry.invalidate(self.address)
+        self.registry.get(self.address)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_max_entries(self):
+        registry = ModelRegistry(loader=self.loader, max_entries=1)
+        other = tempfile.mkstemp()[1]
+        registry.get(self.address)
+        registry.get(other)
+        registry.get(self.address)
+        os.remove(other)
+        self.assertEqual(self.calls, [self.address, other, self.address])
+
+    def test_warm_active(self):
+        media_root = tempfile.mkdtemp()
+        with override_settings(MEDIA_ROOT=media_root):
+            with self.assertNumQueries(0):
+                apps.get_app_config('ml').ready()
+            self.registry.warm_active()
+            with open(TrainingRun.get_path(0, 'index.json'), 'w') as f:
+                f.write('index')
+            self.registry.warm_active()
+            self.assertEqual(self.registry.get(TrainingRun.get_path(0, 'index.json')), 'index')
+            self.assertEqual(self.calls, [TrainingRun.get_path(0, 'index.json')])
+        shutil.rmtree(media_root)
+
+    def test_least_recently_used(self):
+        registry = ModelRegistry(loader=self.loader, max_entries=2)
+        others = [tempfile.mkstemp()[1] for _ in range(2)]
+        registry.get(self.address)
+        registry.get(others[0])
+        registry.get(self.address)
+        registry.get(others[1])
+        registry.get(self.address)
+        registry.get(others[0])
+        for other in others:
+            os.remove(other)
+        self.assertEqual(self.calls, [self.address, others[0], others[1], others[0]])
+
+    def test_file_not_found(self):
+        self.registry.warm(self.address + '.missing')
+        with self.assertRaises(FileNotFoundError):
+            self.registry.get(self.address + '.missing')
+
+
+class CentroidIndexTests(TestCase):
+
+    def test_nearest_centroid(self):
+        rng = np.random.default_rng(0)
+        centers = np.c_[rng.uniform(-24.0, -23.3, 500), rng.uniform(-47.0, -46.3, 500)]
+        points = np.c_[rng.uniform(-24.0, -23.3, 1000), rng.uniform(-47.0, -46.3, 1000)]
+        distances = np.linalg.norm(points[:, None, :] - centers[None, :, :], axis=2)
+        np.testing.assert_array_equal(CentroidIndex(centers).query(points), distances.argmin(axis=1))
+
+    def test_single_point(self):
+        index = CentroidIndex([[-23.5, -46.6], [-23.6, -46.7]])
+        self.assertEqual(index.get_n_clusters(), 2)
+        self.assertEqual(list(index.query(['-23.61', '-46.69'])), [1])
+
+    def test_save_load(self):
+        directory = tempfile.mkdtemp()
+        hotspot = np.arange(11) % 3 == 0
+        centers = np.c_[np.linspace(-24.0, -23.0, 11), np.linspace(-47.0, -46.0, 11)]
+        CentroidIndex(centers, hotspot).save_to(directory + '/index.json')
+        index = CentroidIndex.load(directory + '/index.json')
+        self.assertIsInstance(index.get_centers(), np.memmap)
+        self.assertEqual(index.get_centers().dtype, np.float32)
+        self.assertEqual(index.get_n_clusters(), 11)
+        np.testing.assert_array_equal(index.query(centers), np.arange(11))
+        np.testing.assert_array_equal(index.is_hotspot(np.arange(11)), hotspot)
+        with open(directory + '/index.json') as f:
+            meta = json.load(f)
+        with open(directory + '/index.json', 'w') as f:
+            json.dump(dict(meta, format=0), f)
+        with self.assertRaises(ValueError):
+            CentroidIndex.load(directory + '/index.json')
+        shutil.rmtree(directory)
+
+
+class ApiViewTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+        CentroidIndex([[-23.5, -46.6], [-23.6, -46.7]]).save_to(self.media_root + '/index.json')
+        save_results([{'type': 'FeatureCollection', 'features': [], 'hotspot': False, 'cluster': cluster}
+                      for cluster in range(2)], version=3)
+
+    def tearDown(self):
+        self.settings.disable()
+        registry.invalidate()
+        shutil.rmtree(self.media_root)
+
+    def test_lookup(self):
+        client = Client()
+        response = client.get(reverse('ml:api'), {'latitude': '-23.61', 'longitude': '-46.69'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['cluster'], 1)
+
+    def test_gzip(self):
+        client = Client()
+        response = client.get(reverse('ml:api'), {'latitude': '-23.61', 'longitude': '-46.69'},
+                              HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content))['cluster'], 1)
+
+    def test_not_modified(self):
+        client = Client()
+        response = client.get(reverse('ml:api'), {'latitude': '-23.61', 'longitude': '-46.69'})
+        self.assertEqual(response['ETag'], '"3-1"')
+        response = client.get(reverse('ml:api'), {'latitude': '-23.61', 'longitude': '-46.69'},
+                              HTTP_IF_NONE_MATCH='"3-1"')
+        self.assertEqual(response.status_code, 304)
+        response = client.get(reverse('ml:api'), {'latitude': '-23.61', 'longitude': '-46.69'},
+                              HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        response = client.get(reverse('ml:api'), {'latitude': '-23.61', 'longitude': '-46.69'},
+                              HTTP_IF_NONE_MATCH='"2-1"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_model(self):
+        os.remove(self.media_root + '/index.json')
+        client = Client()
+        response = client.get(reverse('ml:api'), {'latitude': '-23.61', 'longitude': '-46.69'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_convert_legacy_index(self):
+        os.remove(self.media_root + '/index.json')
+        kmeans = MiniBatchKMeans(n_clusters=2, n_init=1, random_state=0).fit(
+            np.array([[-23.5, -46.6], [-23.6, -46.7], [-23.51, -46.61], [-23.61, -46.71]]))
+        dump(kmeans, self.media_root + '/kmeans.joblib')
+        ClusterData.objects.filter(cluster=1).update(hotspot=True)
+        out = io.StringIO()
+        call_command('trainingruns', 'convert', stdout=out)
+        self.assertIn('1 índices convertidos', out.getvalue())
+        index = registry.get(self.media_root + '/index.json')
+        np.testing.assert_allclose(index.get_centers(), kmeans.cluster_centers_, rtol=1e-6)
+        self.assertEqual(index.is_hotspot([0, 1]).tolist(), [False, True])
+        client = Client()
+        response = client.get(reverse('ml:api'), {'latitude': '-23.61', 'longitude': '-46.69'})
+        self.assertEqual(response.json()['cluster'], int(kmeans.predict([[-23.61, -46.69]])[0]))
+        call_command('trainingruns', 'convert', stdout=out)
+        self.assertIn('0 índices convertidos', out.getvalue())
+
+
+class AsyncApiViewTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+        self.run = TrainingRun.objects.create()
+        os.makedirs(self.run.get_directory())
+        CentroidIndex([[-23.5, -46.6], [-23.6, -46.7]], [False, True]).save_to(
+            TrainingRun.get_path(self.run.pk, 'index.json'))
+        save_results([{'type': 'FeatureCollection', 'features': [], 'hotspot': cluster == 1, 'cluster': cluster}
+                      for cluster in range(2)], 3, self.run.pk)
+        self.run.activate()
+        self.factory = AsyncRequestFactory()
+
+    def tearDown(self):
+        self.settings.disable()
+        registry.invalidate()
+        lookup_cache.clear()
+        shutil.rmtree(self.media_root)
+
+    def test_lookup(self):
+        request = self.factory.get('/ml/api?latitude=-23.61&longitude=-46.69')
+        response = async_to_sync(views.api_async)(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['cluster'], 1)
+        self.assertEqual(response['ETag'], '"3-1"')
+        with self.assertNumQueries(0):
+            response = async_to_sync(views.api_async)(request)
+        self.assertEqual(json.loads(response.content)['cluster'], 1)
+        request.META['HTTP_ACCEPT_ENCODING'] = 'gzip'
+        with self.assertNumQueries(0):
+            response = async_to_sync(views.api_async)(request)
+        self.assertEqual(json.loads(gzip.decompress(response.content))['cluster'], 1)
+        request = self.factory.get('/ml/api?latitude=-23.61&longitude=x')
+        self.assertEqual(async_to_sync(views.api_async)(request).status_code, 400)
+
+    def test_pending_run_not_cached(self):
+        pending = TrainingRun.objects.create()
+        copy_run(ClusterData, self.run.pk, pending.pk)
+        shutil.copytree(self.run.get_directory(), pending.get_directory())
+        request = self.factory.get('/ml/api?latitude=-23.61&longitude=-46.69&run={0}'.format(pending.pk))
+        self.assertEqual(async_to_sync(views.api_async)(request)['ETag'], '"3-1"')
+        ClusterData.objects.filter(run=pending.pk).update(version=4)
+        self.assertEqual(async_to_sync(views.api_async)(request)['ETag'], '"4-1"')
+        self.assertIsNone(lookup_cache.get(pending.pk, 1))
+
+    def test_max_bytes(self):
+        cache = LookupCache(max_bytes=10)
+        modified = timezone.now()
+        cache.put(1, 0, '"1-0"', modified, b'12345')
+        cache.put(1, 1, '"1-1"', modified, b'123456')
+        self.assertIsNone(cache.get(1, 0))
+        self.assertEqual(cache.get(1, 1), ('"1-1"', modified, b'123456'))
+        cache.put(1, 2, '"1-2"', modified, b'12345678901')
+        self.assertIsNone(cache.get(1, 2))
+        self.assertEqual(cache.get_size(), 6)
+
+    def test_active_run_ttl(self):
+        request = self.factory.get('/ml/api?latitude=-23.61&longitude=-46.69')
+        async_to_sync(views.api_async)(request)
+        other = TrainingRun.objects.create()
+        other.activate()
+        self.assertEqual(async_to_sync(views.api_async)(request).status_code, 200)
+        lookup_cache.clear()
+        self.assertEqual(async_to_sync(views.api_async)(request).status_code, 404)
+
+    def test_batch(self):
+        request = self.factory.post('/ml/api/batch?features=1', '[[-23.61, -46.69], [-23.49, -46.61]]',
+                                    content_type='application/json')
+        response = async_to_sync(views.api_batch_async)(request)
+        self.assertEqual(json.loads(response.content)['results'], [
+            {'latitude': -23.61, 'longitude': -46.69, 'cluster': 1, 'hotspot': True},
+            {'latitude': -23.49, 'longitude': -46.61, 'cluster': 0, 'hotspot': False}
+        ])
+        self.assertEqual(sorted(json.loads(response.content)['collections']), ['0', '1'])
+        with override_settings(ML_BATCH_MAX_CLUSTERS=1):
+            self.assertEqual(async_to_sync(views.api_batch_async)(request).status_code, 400)
+        self.assertTrue(views.api_batch_async.csrf_exempt)
+        self.assertEqual(async_to_sync(views.api_batch_async)(self.factory.get('/ml/api/batch')).status_code, 405)
+        request = self.factory.post('/ml/api/batch', '[[-23.61]]', content_type='application/json')
+        self.assertEqual(async_to_sync(views.api_batch_async)(request).status_code, 400)
+
+
+class SaveResultsTests(TestCase):
+
+    @staticmethod
+    def get_data(n_clusters):
+        return ({'type': 'FeatureCollection', 'features': [], 'hotspot': cluster % 2 == 0, 'cluster': cluster}
+                for cluster in range(n_clusters))
+
+    def test_columns(self):
+        save_results([{'type': 'FeatureCollection', 'features': [], 'hotspot': hotspot, 'cluster': cluster}
+                      for cluster, hotspot in enumerate([True, False])])
+        self.assertEqual(list(ClusterData.objects.order_by('cluster').values_list('cluster', 'hotspot')),
+                         [(0, True), (1, False)])
+
+    @override_settings(ML_PUBLISH_BATCH_SIZE=2)
+    def test_batches(self):
+        with self.assertNumQueries(4):
+            save_results(self.get_data(5))
+        self.assertEqual(ClusterData.objects.count(), 5)
+
+    def test_run(self):
+        save_results(self.get_data(3))
+        run = TrainingRun.objects.create()
+        save_results(self.get_data(5), 1, run.pk)
+        self.assertEqual(ClusterData.objects.filter(run=TrainingRun.get_active_pk()).count(), 3)
+        self.assertIsNone(run.activate())
+        self.assertEqual(ClusterData.objects.filter(run=TrainingRun.get_active_pk()).count(), 5)
+        other = TrainingRun.objects.create()
+        copy_run(ClusterData, run.pk, other.pk)
+        self.assertEqual(other.activate(), run.pk)
+        self.assertEqual(TrainingRun.objects.filter(active=True).get(), other)
+        self.assertEqual(list(ClusterData.objects.filter(run=other.pk).order_by('cluster').values_list(
+                             'cluster', 'hotspot', 'version')),
+                         list(ClusterData.objects.filter(run=run.pk).order_by('cluster').values_list(
+                             'cluster', 'hotspot', 'version')))
+
+
+    def test_legacy_run(self):
+        save_results(self.get_data(3))
+        ClusterMonthCount.save_table(pd.DataFrame({'GRUPO': [0, 1], 'MES': [1, 1], 'COUNT': [5, 6]}))
+        run = TrainingRun.objects.create()
+        copy_run(ClusterData, None, run.pk)
+        copy_run(ClusterMonthCount, None, run.pk)
+        self.assertEqual(ClusterData.objects.filter(run=run).count(), 3)
+        self.assertEqual(ClusterMonthCount.get_table(ClusterMonthCount.objects.filter(run=run))['COUNT'].sum(), 11)
+        self.assertEqual(len(Client().get(reverse('ml:api_counts'), {'run': 0}).json()['counts']), 2)
+        run.delete()
+        self.assertEqual(ClusterData.objects.count(), 3)
+        self.assertEqual(ClusterMonthCount.objects.count(), 2)
+
+
+class ApiBatchViewTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+        CentroidIndex([[-23.5, -46.6], [-23.6, -46.7]], [False, True]).save_to(self.media_root + '/index.json')
+        for cluster, hotspot in enumerate([False, True]):
+            ClusterData.objects.create(cluster=cluster, hotspot=hotspot,
+                                       data={'type': 'FeatureCollection', 'features': [], 'hotspot': hotspot,
+                                             'cluster': cluster})
+
+    def tearDown(self):
+        self.settings.disable()
+        registry.invalidate()
+        shutil.rmtree(self.media_root)
+
+    def post(self, data, content_type, **params):
+        client = Client()
+        path = reverse('ml:api_batch')
+        if params:
+            path += '?' + '&'.join('{0}={1}'.format(key, value) for key, value in params.items())
+        return client.post(path, data=data, content_type=content_type)
+
+    def test_json(self):
+        response = self.post('[[-23.61, -46.69], [-23.49, -46.61]]', 'application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [
+            {'latitude': -23.61, 'longitude': -46.69, 'cluster': 1, 'hotspot': True},
+            {'latitude': -23.49, 'longitude': -46.61, 'cluster': 0, 'hotspot': False}
+        ])
+        self.assertNotIn('collections', response.json())
+
+    def test_json_object(self):
+        response = self.post('{"points": [{"latitude": -23.61, "longitude": -46.69}]}', 'application/json')
+        self.assertEqual([result['cluster'] for result in response.json()['results']], [1])
+
+    def test_csv(self):
+        response = self.post('latitude,longitude\n-23.61,-46.69\n-23.49,-46.61\n', 'text/csv')
+        self.assertEqual([result['cluster'] for result in response.json()['results']], [1, 0])
+
+    def test_ndjson(self):
+        response = self.post('[-23.61, -46.69]\n{"latitude": -23.49, "longitude": -46.61}\n',
+                             'application/x-ndjson')
+        self.assertEqual([result['cluster'] for result in response.json()['results']], [1, 0])
+
+    def test_collections(self):
+        response = self.post('[[-23.61, -46.69], [-23.62, -46.70]]', 'application/json', features=1)
+        self.assertEqual(list(response.json()['collections']), ['1'])
+        self.assertTrue(response.json()['collections']['1']['hotspot'])
+        points = '[[-23.61, -46.69], [-23.49, -46.61]]'
+        with override_settings(ML_BATCH_MAX_CLUSTERS=1):
+            self.assertEqual(self.post(points, 'application/json', features=1).status_code, 400)
+            self.assertEqual(self.post(points, 'application/json').status_code, 200)
+
+    def test_invalid_points(self):
+        response = self.post('[[-23.61]]', 'application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.post('[["NaN", -46.69]]', 'application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_time(self):
+        buckets = np.zeros((2, 7, 24))
+        buckets[0, :, 22] = buckets[1, :, 10] = 100
+        counts = pd.DataFrame({'GRUPO': [0, 0, 1, 1], 'MES': [1, 2, 1, 2], 'COUNT': [10, 10, 10, 10]})
+        HotspotCube.from_buckets(buckets, counts, 2, 2020 * 12 + 1).save_to(self.media_root + '/cube.json')
+        points = '[[-23.61, -46.69], [-23.49, -46.61]]'
+        response = self.post(points, 'application/json', time='2020-03-02T22:00')
+        self.assertEqual(response.json()['month'], 3)
+        self.assertEqual([result['hotspot'] for result in response.json()['results']], [False, True])
+        response = self.post(points, 'application/json', time='2020-04-02T10:30Z')
+        self.assertEqual(response.json()['month'], 4)
+        self.assertEqual([result['hotspot'] for result in response.json()['results']], [True, False])
+        self.assertEqual(self.post(points, 'application/json', time='2020-05-01T10:00').status_code, 400)
+        self.assertEqual(self.post(points, 'application/json', time='amanhã').status_code, 400)
+
+    def test_get_not_allowed(self):
+        client = Client()
+        response = client.get(reverse('ml:api_batch'))
+        self.assertEqual(response.status_code, 405)
+
+
+class TrainingJobTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        registry.invalidate()
+        shutil.rmtree(self.media_root)
+
+    def test_status(self):
+        client = Client()
+        client.force_login(User.objects.get_or_create(username='test_user')[0])
+        job = TrainingJob.objects.create(filepaths=['/tmp/a.xls'], n_clusters=10)
+        response = client.get(reverse('ml:job_status', args=[job.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], TrainingJob.PENDING)
+        self.assertFalse(response.json()['finished'])
+        self.assertContains(client.get(reverse('ml:job', args=[job.pk])), 'window.location.reload()')
+        finish_job(job, TrainingJob.SUCCESS)
+        self.assertTrue(client.get(reverse('ml:job_status', args=[job.pk])).json()['finished'])
+        self.assertNotContains(client.get(reverse('ml:job', args=[job.pk])), 'poll();')
+
+    def test_run_job(self):
+        filepaths = [write_ssp_file(self.media_root + '/{0}.xls'.format(month), 300, month=month, seed=month)
+                     for month in range(1, 3)]
+        job = TrainingJob.objects.create(filepaths=filepaths, n_clusters=10)
+        self.assertTrue(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, TrainingJob.SUCCESS)
+        self.assertEqual(job.progress, 1.0)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(ClusterData.objects.count(), 10)
+        for name in ['kmeans.joblib', 'index.json', 'viewport.joblib', 'folium.html', 'cube.json']:
+            self.assertTrue(os.path.exists(TrainingRun.get_path(job.metadata['run'], name)))
+        self.assertEqual(TrainingRun.get_active_pk(), job.metadata['run'])
+        self.assertGreater(job.metadata['peak_rss'], 0)
+        self.assertEqual(ClusterMonthCount.get_table()['COUNT'].sum(), 600)
+        self.assertEqual(sorted(ClusterMonthCount.objects.values_list('month', flat=True).distinct()), [1, 2])
+        profile = {stage['stage']: stage for stage in job.metadata['profile']}
+        self.assertEqual(list(profile), ['dataframe', 'kmeans', 'hotspot', 'boundaries', 'viewer', 'viewport',
+                                         'artifacts', 'database', 'activate'])
+        self.assertEqual(profile['dataframe']['rows'], 600)
+        self.assertEqual(profile['database']['rows'], 10)
+        for stage in profile.values():
+            self.assertGreaterEqual(stage['wall_time'], 0)
+            self.assertGreaterEqual(stage['cpu_time'], 0)
+            self.assertGreater(stage['peak_rss'], 0)
+        self.assertNotIn('cprofile', job.metadata)
+
+    def test_run_job_cprofile(self):
+        filepaths = [write_ssp_file(self.media_root + '/1.xls', 300)]
+        job = TrainingJob.objects.create(filepaths=filepaths, n_clusters=10)
+        with override_settings(ML_TRAINING_CPROFILE=True):
+            self.assertTrue(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.metadata['cprofile'], 'profiles/{0}.prof'.format(job.pk))
+        stats = pstats.Stats(self.media_root + '/' + job.metadata['cprofile'])
+        self.assertTrue(any(name == '_process_dataframe' for _, _, name in stats.stats))
+        client = Client()
+        client.force_login(User.objects.get_or_create(username='test_user')[0])
+        self.assertContains(client.get(reverse('ml:job', args=[job.pk])), 'Etapa')
+        self.assertIn('profile', client.get(reverse('ml:job_status', args=[job.pk])).json()['metadata'])
+
+    def test_sweep_job(self):
+        filepaths = [write_ssp_file(self.media_root + '/{0}.xls'.format(month), 300, month=month, seed=month)
+                     for month in range(1, 3)]
+        job = TrainingJob.objects.create(filepaths=filepaths, n_clusters=40, sweep=True, min_clusters=5)
+        self.assertTrue(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, TrainingJob.SUCCESS)
+        scores = job.metadata['sweep']
+        self.assertEqual([score['n_clusters'] for score in scores], ClusterSweep.get_candidates(5, 40, 6))
+        for score in scores:
+            self.assertGreater(score['inertia'], 0)
+            self.assertTrue(-1 <= score['silhouette'] <= 1)
+            self.assertTrue(0 <= score['stability'] <= 1)
+            self.assertGreaterEqual(score['fit_time'], 0)
+        best = max(scores, key=lambda score: score['score'])['n_clusters']
+        self.assertEqual(job.metadata['best_n_clusters'], best)
+        self.assertEqual(ClusterData.objects.count(), best)
+        client = Client()
+        client.force_login(User.objects.get_or_create(username='test_user')[0])
+        self.assertContains(client.get(reverse('ml:job', args=[job.pk])), 'Estabilidade')
+
+    def test_incremental_job(self):
+        filepaths = [write_ssp_file(self.media_root + '/{0}.xls'.format(month), 300, month=month, seed=month)
+                     for month in range(1, 4)]
+        first = TrainingJob.objects.create(filepaths=filepaths[:2], n_clusters=10)
+        run_job(first)
+        before = {obj.cluster: obj for obj in ClusterData.objects.all()}
+        job = TrainingJob.objects.create(filepaths=filepaths[2:], n_clusters=10, incremental=True)
+        self.assertTrue(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, TrainingJob.SUCCESS)
+        self.assertEqual(job.metadata['new_rows'], 300)
+        self.assertEqual(ClusterMonthCount.objects.filter(month=3).aggregate(Sum('count'))['count__sum'], 300)
+        self.assertEqual(ClusterMonthCount.get_table()['COUNT'].sum(), 900)
+        after = {obj.cluster: obj for obj in ClusterData.objects.filter(run=TrainingRun.get_active_pk())}
+        n_points = 0
+        for cluster, obj in after.items():
+            points = [feature for feature in obj.data['features'] if feature['geometry']['type'] == 'Point']
+            n_points += len(points)
+            self.assertEqual(obj.data['features'][-1]['geometry']['type'], 'LineString')
+            self.assertTrue(all(feature['hotspot'] == obj.hotspot for feature in obj.data['features']))
+            if obj.version != job.pk:
+                self.assertEqual(obj.data, before[cluster].data)
+        self.assertEqual(n_points, 900)
+        self.assertEqual(len(after), 10)
+        self.assertEqual(TrainingRun.objects.get(active=True).job, job)
+        cube = HotspotCube.load(TrainingRun.get_path(job.metadata['run'], 'cube.json'))
+        self.assertEqual(cube.get_months()[0], 4)
+        self.assertEqual(cube.get_month(datetime(2020, 4, 1)), 4)
+        first.refresh_from_db()
+        self.assertEqual(set(ClusterData.objects.values_list('run', flat=True)),
+                         {first.metadata['run'], job.metadata['run']})
+        self.assertEqual(ClusterMonthCount.get_table(ClusterMonthCount.objects.filter(
+            run=first.metadata['run']))['COUNT'].sum(), 600)
+
+    @override_settings(ML_TRAINING_RUNS_KEEP=2)
+    def test_runs(self):
+        filepaths = [write_ssp_file(self.media_root + '/1.xls', 300)]
+        jobs = [TrainingJob.objects.create(filepaths=filepaths, n_clusters=n_clusters) for n_clusters in [10, 8, 6, 4]]
+        for job in jobs:
+            self.assertTrue(run_job(job))
+            job.refresh_from_db()
+        runs = list(TrainingRun.objects.order_by('pk'))
+        self.assertEqual([run.job for run in runs], jobs[1:])
+        self.assertEqual(TrainingRun.objects.get(active=True).job, jobs[3])
+        self.assertFalse(os.path.exists(TrainingRun.get_path(jobs[0].metadata['run'], 'index.json')))
+        self.assertEqual(ClusterData.objects.count(), 8 + 6 + 4)
+
+        client = Client()
+        params = {'latitude': -23.55, 'longitude': -46.63}
+        self.assertLess(client.get(reverse('ml:api'), params).json()['cluster'], 4)
+        params['run'] = jobs[1].metadata['run']
+        self.assertLess(client.get(reverse('ml:api'), params).json()['cluster'], 8)
+        counts = client.get(reverse('ml:api_counts'), {'run': params['run']}).json()['counts']
+        self.assertEqual({count['cluster'] for count in counts}, set(range(8)))
+
+        run = rollback_run()
+        self.assertEqual(run.job, jobs[2])
+        self.assertEqual(TrainingRun.get_active_pk(), run.pk)
+        del params['run']
+        self.assertLess(client.get(reverse('ml:api'), params).json()['cluster'], 6)
+
+        out = io.StringIO()
+        call_command('trainingruns', 'activate', str(runs[-1].pk), stdout=out)
+        self.assertEqual(TrainingRun.get_active_pk(), runs[-1].pk)
+        self.assertEqual([run.job for run in collect_runs(0)], [jobs[2], jobs[1]])
+        self.assertEqual(list(TrainingRun.objects.all()), [runs[-1]])
+        self.assertEqual(ClusterData.objects.count(), 4)
+        self.assertIsNone(rollback_run())
+
+    def test_failed_job(self):
+        ClusterData.objects.create(cluster=0, data={})
+        job = TrainingJob.objects.create(filepaths=[self.media_root + '/missing.xls'], n_clusters=10)
+        self.assertFalse(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, TrainingJob.FAILED)
+        self.assertIn('FileNotFoundError', job.error)
+        self.assertEqual(ClusterData.objects.count(), 1)
+
+    def test_failed_job_discards_run(self):
+        job = TrainingJob.objects.create(filepaths=['/tmp/a.xls'], n_clusters=10)
+        run = TrainingRun.objects.create(job=job)
+        os.makedirs(run.get_directory())
+        save_results([{'type': 'FeatureCollection', 'features': [], 'hotspot': False, 'cluster': 0}], job.pk, run.pk)
+        ClusterData.objects.create(cluster=0, data={})
+        finish_job(job, TrainingJob.FAILED, 'erro')
+        self.assertFalse(TrainingRun.objects.exists())
+        self.assertFalse(os.path.exists(run.get_directory()))
+        self.assertEqual(list(ClusterData.objects.values_list('run', flat=True)), [None])
+
+    def test_worker_recovers_running_jobs(self):
+        expired = timezone.now() - timedelta(seconds=120)
+        job = TrainingJob.objects.create(filepaths=['/tmp/a.xls'], n_clusters=10, status=TrainingJob.RUNNING,
+                                         worker='host:1', heartbeat_at=expired)
+        live = TrainingJob.objects.create(filepaths=['/tmp/a.xls'], n_clusters=10, status=TrainingJob.RUNNING,
+                                          worker='host:2', heartbeat_at=timezone.now())
+        run = TrainingRun.objects.create(job=job)
+        os.makedirs(run.get_directory())
+        save_results([{'type': 'FeatureCollection', 'features': [], 'hotspot': False, 'cluster': 0}], job.pk, run.pk)
+        out = io.StringIO()
+        call_command('trainworker', '--once', '--poll', '0', stdout=out)
+        job.refresh_from_db()
+        self.assertEqual(job.status, TrainingJob.FAILED)
+        self.assertIsNotNone(job.finished_at)
+        self.assertFalse(TrainingRun.objects.exists())
+        self.assertFalse(os.path.exists(run.get_directory()))
+        self.assertFalse(ClusterData.objects.exists())
+        self.assertIn('host:1', job.error)
+        self.assertIn(str(job.pk), out.getvalue())
+        live.refresh_from_db()
+        self.assertEqual(live.status, TrainingJob.RUNNING)
+
+    def test_claim_job(self):
+        job = TrainingJob.objects.create(filepaths=['/tmp/a.xls'], n_clusters=10)
+        self.assertEqual(claim_job('host:1'), job)
+        job.refresh_from_db()
+        self.assertEqual(job.worker, 'host:1')
+        self.assertIsNotNone(job.heartbeat_at)
+        TrainingJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=120))
+        self.assertEqual(renew_jobs([job.pk]), 1)
+        self.assertEqual(recover_jobs(), [])
+        with override_settings(ML_TRAINING_LEASE=0):
+            self.assertEqual(recover_jobs(), [job])
+
+
+def reference_results(predictor):
+    results = []
+    df_all = predictor.get_df()
+    hotspot = predictor.get_hotspot()
+    boundaries = predictor.get_boundaries()
+    for cluster in range(len(hotspot)):
+        df = df_all[df_all['GRUPO'] == cluster]
+        features = [{
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [float(np.round(np.float64(row['LATITUDE']), 6)),
+                                                          float(np.round(np.float64(row['LONGITUDE']), 6))]},
+            'properties': {'date': row['DATAOCORRENCIA'], 'time': row['HORAOCORRENCIA']},
+            'hotspot': bool(hotspot[cluster]),
+            'cluster': cluster
+        } for idx, row in df.iterrows()]
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'LineString', 'coordinates': boundaries.get(cluster, [])},
+            'hotspot': bool(hotspot[cluster]),
+            'cluster': cluster
+        })
+        results.append({'type': 'FeatureCollection', 'features': features, 'hotspot': bool(hotspot[cluster]),
+                        'cluster': cluster})
+    return results
+
+
+def reference_counts(counts, n_clusters, month):
+    pipeline = ColumnTransformer([
+        ('grupo', OneHotEncoder(categories=[np.arange(n_clusters, dtype='int32')]), ['GRUPO']),
+        ('mes', 'passthrough', ['MES'])
+    ])
+    lr = LinearRegression()
+    lr.fit(pipeline.fit_transform(counts), counts['COUNT'])
+    return lr.predict(np.c_[np.identity(n_clusters), np.ones(n_clusters) * month])
+
+
+class HotspotPredictorTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        filepaths = [write_ssp_file(cls.directory + '/{0}.xls'.format(month), 500, month=month, seed=month)
+                     for month in range(1, 4)]
+        cls.predictor = HotspotPredictor(filepaths=filepaths, n_clusters=15)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+        super().tearDownClass()
+
+    def test_results(self):
+        self.assertEqual(self.predictor.get_results(), reference_results(self.predictor))
+
+    def test_viewer_from_dataframe(self):
+        for mode in HotspotViewer.MODES:
+            viewer = HotspotViewer(mode=mode, df=self.predictor.get_df(), hotspot=self.predictor.get_hotspot(),
+                                   boundaries=self.predictor.get_boundaries())
+            locations, properties, boundaries = viewer._parse_clusters_data(self.predictor.iter_results())
+            expected = viewer._parse_dataframe(self.predictor.get_df(), self.predictor.get_hotspot(),
+                                               self.predictor.get_boundaries())
+            np.testing.assert_array_equal(expected[0], locations)
+            self.assertEqual(expected[1:], (properties, boundaries))
+
+    def test_iter_results(self):
+        results = self.predictor.iter_results()
+        self.assertNotIsInstance(results, list)
+        self.assertEqual([data['cluster'] for data in results], list(range(15)))
+        coordinates = [coordinate for data in self.predictor.iter_results() for feature in data['features']
+                       if feature['geometry']['type'] == 'Point' for coordinate in feature['geometry']['coordinates']]
+        self.assertTrue(all(len(repr(coordinate).split('.')[1]) <= 6 for coordinate in coordinates))
+
+    def test_predict_counts(self):
+        rng = np.random.default_rng(0)
+        counts = pd.DataFrame([(cluster, month, rng.integers(1, 50)) for cluster in range(45) for month in range(1, 5)
+                               if rng.random() < 0.9], columns=['GRUPO', 'MES', 'COUNT'])
+        expected = reference_counts(counts, 50, 5)
+        for solver in HotspotPredictor.SOLVERS:
+            predicted = HotspotPredictor.predict_counts(counts, 50, 5, solver)
+            np.testing.assert_allclose(predicted, expected, rtol=1e-4)
+        np.testing.assert_allclose(HotspotPredictor.predict_counts(counts[counts['MES'] == 1], 50, 2),
+                                   reference_counts(counts[counts['MES'] == 1], 50, 2), rtol=1e-6)
+
+    def test_predict_hotspot(self):
+        counts = self.predictor.get_counts()
+        expected = reference_counts(counts, 15, 4) >= counts['COUNT'].median()
+        for solver in HotspotPredictor.SOLVERS:
+            hotspot = HotspotPredictor.predict_hotspot(counts, 15, 4, solver)
+            self.assertEqual([bool(hotspot[cluster]) for cluster in range(15)], expected.tolist())
+        self.assertEqual(self.predictor.get_hotspot(), HotspotPredictor.predict_hotspot(counts, 15, 4))
+        with self.assertRaises(ValueError):
+            HotspotPredictor.predict_counts(counts, 15, 4, 'dense')
+
+    def test_hotspot_cube(self):
+        df, counts = self.predictor.get_df(), self.predictor.get_counts()
+        cube = HotspotCube.build(df, counts, 15, 2)
+        self.assertEqual(cube.get_months(), range(4, 6))
+        self.assertEqual(cube.get_month(datetime(2020, 4, 30, 23)), 4)
+        self.assertEqual(cube.get_month(datetime(2020, 6, 1)), 6)
+        with self.assertRaises(ValueError):
+            cube.query(6, 0, 0)
+
+        time = df['DATAHORA'].dt
+        observed = df[(time.dayofweek == 4) & (time.hour == 18)].groupby('GRUPO').size().reindex(range(15),
+                                                                                                 fill_value=0)
+        totals = df.groupby('GRUPO').size().reindex(range(15), fill_value=0)
+        share = ((time.dayofweek == 4) & (time.hour == 18)).mean()
+        expected = reference_counts(counts, 15, 5) * (observed + 24 * share) / (totals + 24)
+        scores, hotspot = cube.query(5, 4, 18)
+        np.testing.assert_allclose(scores, expected, rtol=1e-4)
+        np.testing.assert_array_equal(hotspot, expected >= counts['COUNT'].median() * share)
+        self.assertEqual(cube.query(5, 4, 18, [3, 1])[0].tolist(), scores[[3, 1]].tolist())
+
+        uniform = HotspotCube.from_buckets(np.ones((15, 7, 24)), counts, 1)
+        expected = self.predictor.get_hotspot()
+        for weekday, hour in [(0, 0), (3, 12), (6, 23)]:
+            self.assertEqual(uniform.query(4, weekday, hour)[1].tolist(), [bool(expected[i]) for i in range(15)])
+
+        first = df['MES'] < 3
+        extended = HotspotCube.build(df[first], counts[counts['MES'] < 3], 15, 2).extend(df[~first], counts, 2)
+        np.testing.assert_allclose(extended.query(5, 4, 18)[0], scores, rtol=1e-6)
+        self.assertEqual(extended.get_month(datetime(2020, 4, 1)), 4)
+
+        directory = tempfile.mkdtemp()
+        cube.save_to(directory + '/cube.json')
+        loaded = HotspotCube.load(directory + '/cube.json')
+        self.assertEqual(loaded.get_months(), range(4, 6))
+        np.testing.assert_array_equal(loaded.query(5, 4, 18)[0], scores)
+        self.assertEqual(loaded.get_month(datetime(2020, 5, 1)), 5)
+        shutil.rmtree(directory)
+
+
+class DataframeCacheTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filepath = write_ssp_file(self.directory + '/1.xls', 100)
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def parse(self, filepath):
+        self.calls.append(filepath)
+        return HotspotPredictor._parse_dataframe(filepath)
+
+    def test_parse_once(self):
+        first = dataframe_cache.load(self.filepath, self.parse)
+        second = dataframe_cache.load(self.filepath, self.parse)
+        self.assertEqual(self.calls, [self.filepath])
+        self.assertTrue(os.path.exists(dataframe_cache.get_cache_path(self.filepath)))
+        np.testing.assert_array_equal(first['LATITUDE'].to_numpy(), second['LATITUDE'].to_numpy())
+
+    def test_schema(self):
+        df = dataframe_cache.load(self.filepath, self.parse)
+        self.assertEqual(df['LATITUDE'].dtype, np.float32)
+        self.assertEqual(df['LONGITUDE'].dtype, np.float32)
+        self.assertTrue(np.issubdtype(df['DATAHORA'].dtype, np.datetime64))
+        for col in HotspotPredictor.CATEGORY_COLUMNS:
+            self.assertIsInstance(df[col].dtype, pd.CategoricalDtype)
+        self.assertEqual(len(df), 100)
+
+    def test_month_dtype(self):
+        df = HotspotPredictor._load_dataframe(self.filepath, 200)
+        self.assertEqual(df['MES'].dtype, np.int16)
+        self.assertEqual(df['MES'].max(), 200)
+
+    def test_stale_cache(self):
+        dataframe_cache.load(self.filepath, self.parse)
+        cachepath = dataframe_cache.get_cache_path(self.filepath)
+        os.utime(cachepath, (0, 0))
+        dataframe_cache.load(self.filepath, self.parse)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_parallel_loading(self):
+        filepaths = [write_ssp_file(self.directory + '/{0}.xls'.format(month), 100, month=month, seed=month)
+                     for month in range(2, 5)]
+        sequential = HotspotPredictor.load_dataframe(filepaths)
+        for filepath in filepaths:
+            dataframe_cache.remove(filepath)
+        parallel = HotspotPredictor.load_dataframe(filepaths, n_jobs=2)
+        self.assertTrue(sequential.equals(parallel))
+        self.assertEqual(list(parallel['MES'].unique()), [1, 2, 3])
+        self.assertEqual(parallel['MES'].dtype, np.int16)
+        self.assertIsInstance(parallel['BAIRRO'].dtype, pd.CategoricalDtype)
+
+    def test_chunked_parsing(self):
+        with open(self.filepath, encoding='utf-16 le') as f:
+            lines = f.readlines()
+        with open(self.filepath, 'a', encoding='utf-16 le') as f:
+            f.writelines(lines[1:30])
+        df = HotspotPredictor._parse_dataframe(self.filepath)
+        chunked = HotspotPredictor._parse_dataframe(self.filepath, chunksize=16)
+        self.assertEqual(len(chunked), 100)
+        self.assertTrue(df.reset_index(drop=True).equals(chunked))
+
+    def test_chunked_predictor(self):
+        predictor = HotspotPredictor(filepaths=[self.filepath], n_clusters=5, chunksize=30)
+        self.assertEqual(predictor.get_kmeans().cluster_centers_.shape, (5, 2))
+        self.assertEqual(len(predictor.get_df()), 100)
+        self.assertTrue(predictor.get_df()['GRUPO'].between(0, 4).all())
+
+    def test_remove(self):
+        dataframe_cache.load(self.filepath, self.parse)
+        dataframe_cache.remove(self.filepath)
+        dataframe_cache.remove(self.filepath)
+        self.assertFalse(os.path.exists(dataframe_cache.get_cache_path(self.filepath)))
+
+
+def polygon_area(polygon):
+    x, y = np.asarray(polygon).T
+    return abs(x @ np.roll(y, -1) - y @ np.roll(x, -1)) / 2
+
+
+class VoronoiTests(TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.centers = np.c_[rng.uniform(-23.75, -23.45, 300), rng.uniform(-46.80, -46.40, 300)]
+
+    def test_polygons_cover_bounds(self):
+        boundaries = voronoi.get_polygons(self.centers)
+        south, west, north, east = voronoi.get_extent(self.centers)
+        self.assertAlmostEqual(sum(polygon_area(boundaries[cluster]) for cluster in range(300)),
+                               (north - south) * (east - west))
+        vertices = np.concatenate([boundaries[cluster] for cluster in range(300)])
+        self.assertTrue(((vertices >= [south, west]) & (vertices <= [north, east])).all())
+        centroids = np.array([np.mean(boundaries[cluster], axis=0) for cluster in range(300)])
+        self.assertEqual(CentroidIndex(self.centers).query(centroids).tolist(), list(range(300)))
+
+    def test_interior_cells(self):
+        boundaries = voronoi.get_polygons(self.centers)
+        vor = Voronoi(self.centers)
+        for cluster in range(300):
+            region = vor.regions[vor.point_region[cluster]]
+            if -1 not in region:
+                self.assertEqual(sorted(np.round(vor.vertices[region], 9).tolist()),
+                                 sorted(np.round(boundaries[cluster], 9).tolist()))
+
+    def test_small_and_duplicate_centers(self):
+        self.assertEqual(len(voronoi.get_polygons(self.centers[:1])[0]), 4)
+        self.assertEqual(len(voronoi.get_polygons(self.centers[:2])), 2)
+        boundaries = voronoi.get_polygons(np.r_[self.centers[:10], self.centers[:5]])
+        self.assertEqual(len(boundaries), 15)
+        self.assertEqual(boundaries[12], boundaries[2])
+
+    def test_cache(self):
+        self.assertIs(voronoi.get_boundaries(self.centers), voronoi.get_boundaries(self.centers.copy()))
+        self.assertIsNot(voronoi.get_boundaries(self.centers), voronoi.get_boundaries(self.centers[:100]))
+
+
+class HotspotViewerTests(TestCase):
+
+    def setUp(self):
+        points = [{'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [-23.5 + i * 1e-5, -46.6]},
+                   'properties': {'date': '01/01/2020', 'time': '12:00'}, 'hotspot': True, 'cluster': 0}
+                  for i in range(50)]
+        boundary = {'type': 'Feature', 'geometry': {'type': 'LineString', 'coordinates': [[-23.4, -46.5],
+                                                                                          [-23.6, -46.5],
+                                                                                          [-23.6, -46.7]]},
+                    'hotspot': True, 'cluster': 0}
+        self.clusters_data = [{'type': 'FeatureCollection', 'features': points + [boundary], 'hotspot': True,
+                               'cluster': 0}]
+
+    def render(self, mode):
+        return HotspotViewer(self.clusters_data, mode=mode).get_result().get_root().render()
+
+    def test_heatmap(self):
+        html = self.render('heatmap')
+        self.assertIn('heatLayer', html)
+        self.assertNotIn('L.circle(', html)
+
+    def test_cluster(self):
+        self.assertIn('markerClusterGroup', self.render('cluster'))
+
+    def test_circles(self):
+        self.assertEqual(self.render('circles').count('L.circle('), 50)
+
+    def test_aggregation(self):
+        cells, counts = HotspotViewer(self.clusters_data)._aggregate(np.array([[-23.5, -46.6], [-23.50001, -46.6],
+                                                                                [-23.6, -46.6]]))
+        self.assertEqual(sorted(counts.tolist()), [1, 2])
+
+    def test_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            HotspotViewer(self.clusters_data, mode='tiles')
+
+
+class ApiBboxViewTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root, ML_VIEWPORT_PAGE_SIZE=1)
+        self.settings.enable()
+        boundaries = {
+            0: [[-23.0, -47.0], [-23.0, -46.5], [-23.5, -46.5], [-23.5, -47.0]],
+            1: [[-23.5, -47.0], [-23.5, -46.5], [-24.0, -46.5], [-24.0, -47.0]]
+        }
+        df = pd.DataFrame({
+            'LATITUDE': [-23.2, -23.3, -23.7, -23.9],
+            'LONGITUDE': [-46.8, -46.6, -46.8, -46.6],
+            'GRUPO': [0, 0, 1, 1],
+            'DATAOCORRENCIA': ['01/01/2020', '02/01/2020', '03/01/2020', '04/01/2020'],
+            'HORAOCORRENCIA': ['10:00', '11:00', '12:00', '13:00']
+        })
+        ViewportIndex(boundaries, [True, False], df).save_to(self.media_root + '/viewport.joblib')
+
+    def tearDown(self):
+        self.settings.disable()
+        registry.invalidate()
+        shutil.rmtree(self.media_root)
+
+    def get(self, **params):
+        client = Client()
+        return client.get(reverse('ml:api_bbox'), params)
+
+    def test_polygons(self):
+        response = self.get(south=-23.4, west=-46.9, north=-23.1, east=-46.7)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([feature['cluster'] for feature in response.json()['features']], [0])
+        self.assertTrue(response.json()['features'][0]['hotspot'])
+
+    def test_points(self):
+        response = self.get(south=-23.4, west=-46.9, north=-23.1, east=-46.7, points=1)
+        points = [feature for feature in response.json()['features'] if feature['geometry']['type'] == 'Point']
+        self.assertEqual(len(points), 1)
+        self.assertEqual(points[0]['properties'], {'date': '01/01/2020', 'time': '10:00'})
+        self.assertEqual(points[0]['geometry']['coordinates'], [-23.2, -46.8])
+
+    def test_pagination(self):
+        first = self.get(south=-23.8, west=-46.9, north=-23.1, east=-46.5, points=1).json()
+        second = self.get(south=-23.8, west=-46.9, north=-23.1, east=-46.5, points=1, page=2).json()
+        self.assertEqual(first['pages'], 2)
+        self.assertEqual({feature['cluster'] for feature in first['features']}, {0})
+        self.assertEqual({feature['cluster'] for feature in second['features']}, {1})
+        self.assertEqual(len(second['features']), 2)
+
+    def test_max_points(self):
+        response = self.get(south=-23.4, west=-46.9, north=-23.1, east=-46.5, points=1, max_points=1)
+        self.assertEqual(len(response.json()['features']), 2)
+        self.assertTrue(response.json()['truncated'])
+
+    def test_invalid_bbox(self):
+        self.assertEqual(self.get(south=-23.1, west=-46.9, north=-23.4, east=-46.7).status_code, 400)
+        self.assertEqual(self.get(south=-23.1, west=-46.9).status_code, 400)
+        self.assertEqual(self.get(south=-24, west=-47, north=1e9, east=-46, points=1).status_code, 400)
+        self.assertEqual(self.get(south=-24, west=-181, north=-23, east=-46).status_code, 400)
+
+    def test_large_bbox(self):
+        response = self.get(south=-90, west=-180, north=90, east=180, points=1, page_size=1)
+        self.assertEqual(response.status_code, 200)
+        index = registry.get(self.media_root + '/viewport.joblib')
+        self.assertEqual(len(index.query_points(-24, -47, 1e9, 1e9)), 4)
+        self.assertEqual(len(index.query_points(-1e9, -1e9, -23.5, -46.7)), 1)
+
+
+class ApiCountsViewTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+        CentroidIndex([[-23.5, -46.6], [-23.6, -46.7], [-23.7, -46.8]]).save_to(self.media_root + '/index.json')
+        ClusterMonthCount.save_table(pd.DataFrame({
+            'GRUPO': [0, 0, 1, 1, 2],
+            'MES': [1, 2, 1, 2, 1],
+            'COUNT': [10, 20, 5, 4, 1]
+        }))
+
+    def tearDown(self):
+        self.settings.disable()
+        registry.invalidate()
+        shutil.rmtree(self.media_root)
+
+    def test_counts(self):
+        client = Client()
+        response = client.get(reverse('ml:api_counts'), {'cluster': 1})
+        self.assertEqual(response.json()['counts'], [{'cluster': 1, 'month': 1, 'count': 5},
+                                                     {'cluster': 1, 'month': 2, 'count': 4}])
+        response = client.get(reverse('ml:api_counts'))
+        self.assertEqual(len(response.json()['counts']), 5)
+
+    def test_hotspots(self):
+        client = Client()
+        response = client.get(reverse('ml:api_hotspots'))
+        self.assertEqual(response.json(), {'month': 3, 'hotspots': [0, 1, 2]})
+        response = client.get(reverse('ml:api_hotspots'), {'month': 1})
+        self.assertEqual(response.json(), {'month': 1, 'hotspots': [0]})
+        response = client.get(reverse('ml:api_hotspots'), {'month': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_hotspots_time(self):
+        client = Client()
+        response = client.get(reverse('ml:api_hotspots'), {'time': '2020-03-02T10:00'})
+        self.assertEqual(response.status_code, 404)
+        counts = ClusterMonthCount.get_table()
+        HotspotCube.from_buckets(np.ones((3, 7, 24)), counts, 2, 2020 * 12 + 1).save_to(self.media_root + '/cube.json')
+        response = client.get(reverse('ml:api_hotspots'), {'time': '2020-03-02T10:00', 'scores': 1})
+        self.assertEqual(response.json()['month'], 3)
+        self.assertEqual(response.json()['weekday'], 0)
+        self.assertEqual(response.json()['hour'], 10)
+        self.assertEqual(response.json()['hotspots'], [0, 1, 2])
+        np.testing.assert_allclose(response.json()['scores'], reference_counts(counts, 3, 3) / 168, rtol=1e-5)
+        response = client.get(reverse('ml:api_hotspots'), {'time': '2020-03-02T10:00', 'month': 4})
+        self.assertEqual(response.json()['month'], 4)
+        response = client.get(reverse('ml:api_hotspots'), {'time': '2020-03-02T10:00', 'month': 5})
+        self.assertEqual(response.status_code, 400)
+
+
+class BenchmarkCommandTests(TestCase):
+
+    def test_pipeline(self):
+        directory = tempfile.mkdtemp()
+        try:
+            output = directory + '/benchmark.json'
+            call_command('benchmark', 'pipeline', '--sizes', '600', '--clusters', '5', '400', '--months', '2',
+                         '--queries', '5', '--output', output, stdout=io.StringIO())
+            with open(output) as f:
+                report = json.load(f)
+        finally:
+            shutil.rmtree(directory)
+        self.assertIn('commit', report['environment'])
+        self.assertEqual(len(report['results']), 1)
+        result = report['results'][0]
+        self.assertEqual((result['rows'], result['clusters'], result['months']), (600, 5, 2))
+        self.assertEqual([stage['stage'] for stage in result['stages']],
+                         ['dataframe', 'kmeans', 'hotspot', 'boundaries', 'viewer', 'viewport', 'artifacts',
+                          'database', 'activate'])
+        self.assertEqual(result['api']['queries'], 5)
+        self.assertEqual(ClusterData.objects.count(), 0)
+
+
+class LoadBenchmarkTests(LiveServerTestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+        CentroidIndex([[-23.5, -46.6], [-23.6, -46.7]]).save_to(self.media_root + '/index.json')
+        save_results([{'type': 'FeatureCollection', 'features': [], 'hotspot': False, 'cluster': cluster}
+                      for cluster in range(2)])
+
+    def tearDown(self):
+        self.settings.disable()
+        registry.invalidate()
+        shutil.rmtree(self.media_root)
+
+    def test_load(self):
+        output = self.media_root + '/load.json'
+        call_command('benchmark', 'load', '--urls', 'live=' + self.live_server_url, '--requests', '40',
+                     '--concurrency', '2', '--batch-size', '5', '--output', output, stdout=io.StringIO())
+        with open(output) as f:
+            report = json.load(f)
+        self.assertEqual(report['batch_size'], 5)
+        self.assertEqual(len(report['results']), 1)
+        result = report['results'][0]
+        self.assertEqual((result['server'], result['requests'], result['errors']), ('live', 40, 0))
+        self.assertGreater(result['rps'], 0)
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
@@ -0,0 +1,269 @@
+import os
+import shutil
+import traceback
+from datetime import timedelta
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from joblib import load
+from ml.centroid_index import CentroidIndex
+from ml.cluster_sweep import ClusterSweep
+from ml.hotspot_cube import HotspotCube
+from ml.hotspot_predictor import HotspotPredictor
+from ml.hotspot_viewer import HotspotViewer
+from ml.models import ClusterData
+from ml.models import ClusterMonthCount
+from ml.models import TrainingRun
+from ml.models import copy_run
+from ml.models import TrainingJob
+from ml.profiler import StageProfiler
+from ml.profiler import get_peak_rss
+from ml.viewport_index import ViewportIndex
+
+
+def claim_job(worker=''):
+    with transaction.atomic():
+        job = TrainingJob.objects.select_for_update(skip_locked=True).filter(
+            status=TrainingJob.PENDING).order_by('created_at').first()
+        if job is not None:
+            job.status = TrainingJob.RUNNING
+            job.worker = worker
+            job.started_at = job.heartbeat_at = timezone.now()
+            job.save(update_fields=['status', 'worker', 'started_at', 'heartbeat_at'])
+        return job
+
+
+def renew_jobs(pks):
+    return TrainingJob.objects.filter(pk__in=pks, status=TrainingJob.RUNNING).update(heartbeat_at=timezone.now())
+
+
+def recover_jobs():
+    expired = timezone.now() - timedelta(seconds=settings.ML_TRAINING_LEASE)
+    with transaction.atomic():
+        jobs = list(TrainingJob.objects.select_for_update(skip_locked=True).filter(
+            Q(heartbeat_at__lt=expired) | Q(heartbeat_at__isnull=True), status=TrainingJob.RUNNING))
+        for job in jobs:
+            finish_job(job, TrainingJob.FAILED, 'Treinamento interrompido: worker {0} sem resposta'.format(job.worker))
+    return jobs
+
+
+def run_job(job):
+    profiler = StageProfiler(cprofile=settings.ML_TRAINING_CPROFILE)
+    try:
+        if job.incremental:
+            run_incremental(job, profiler)
+            finish_job(job, TrainingJob.SUCCESS, profiler=profiler)
+            return True
+        n_clusters = run_sweep(job, profiler) if job.sweep else job.n_clusters
+        predictor = HotspotPredictor(filepaths=job.filepaths, n_clusters=n_clusters,
+                                     progress=lambda stage, progress: update_progress(job, stage, progress, profiler),
+                                     n_jobs=settings.ML_LOAD_WORKERS, chunksize=settings.ML_TRAINING_CHUNKSIZE)
+        profiler.set_rows('dataframe', len(predictor.get_df()))
+        profiler.set_rows('kmeans', len(predictor.get_df()))
+        profiler.set_rows('hotspot', len(predictor.get_counts()))
+        profiler.set_rows('boundaries', len(predictor.get_hotspot()))
+        update_progress(job, 'publish', 0.6)
+        publish(predictor, job, profiler)
+    except Exception:
+        finish_job(job, TrainingJob.FAILED, traceback.format_exc(), profiler)
+        return False
+    finish_job(job, TrainingJob.SUCCESS, profiler=profiler)
+    return True
+
+
+def run_sweep(job, profiler=None):
+    profiler = profiler or StageProfiler()
+    update_progress(job, 'sweep', 0.0, profiler)
+    df = HotspotPredictor.load_dataframe(job.filepaths, settings.ML_LOAD_WORKERS, settings.ML_TRAINING_CHUNKSIZE)
+    profiler.set_rows('sweep', len(df))
+    candidates = ClusterSweep.get_candidates(job.min_clusters or 2, job.n_clusters, settings.ML_SWEEP_STEPS)
+    sweep = ClusterSweep(df, candidates, n_jobs=settings.ML_SWEEP_WORKERS, sample_size=settings.ML_SWEEP_SAMPLE)
+    best = sweep.get_best() or job.n_clusters
+    job.metadata.update(sweep=sweep.get_scores(), best_n_clusters=best)
+    job.save(update_fields=['metadata'])
+    return best
+
+
+def update_progress(job, stage, progress, profiler=None):
+    if profiler is not None:
+        profiler.start(stage)
+    job.stage = stage
+    job.progress = progress
+    job.save(update_fields=['stage', 'progress'])
+
+
+def finish_job(job, status, error='', profiler=None):
+    job.status = status
+    job.error = error
+    job.finished_at = timezone.now()
+    job.metadata.update(get_peak_rss(), chunksize=settings.ML_TRAINING_CHUNKSIZE)
+    if status == TrainingJob.FAILED:
+        discard_runs(job)
+    if profiler is not None:
+        profiler.stop()
+        job.metadata.update(profile=profiler.get_stages(), profile_total=profiler.get_total())
+        name = 'profiles/{0}.prof'.format(job.pk)
+        if profiler.dump_to(settings.MEDIA_ROOT + '/' + name):
+            job.metadata['cprofile'] = name
+    fields = ['status', 'error', 'finished_at', 'metadata']
+    if status == TrainingJob.SUCCESS:
+        job.stage = ''
+        job.progress = 1.0
+        fields += ['stage', 'progress']
+    job.save(update_fields=fields)
+
+
+def publish(predictor, job=None, profiler=None):
+    profiler = profiler or StageProfiler()
+    hotspot = predictor.get_hotspot()
+    run = TrainingRun.objects.create(job=job)
+    os.makedirs(run.get_directory(), exist_ok=True)
+    if job is not None:
+        job.metadata['run'] = run.pk
+    profiler.start('viewer', len(predictor.get_df()))
+    viewer = HotspotViewer(mode=settings.ML_MAP_MODE, df=predictor.get_df(), hotspot=hotspot,
+                           boundaries=predictor.get_boundaries())
+    profiler.start('viewport', len(predictor.get_df()))
+    viewport_index = ViewportIndex(predictor.get_boundaries(), [hotspot[cluster] for cluster in range(len(hotspot))],
+                                   predictor.get_df())
+    profiler.start('artifacts')
+    predictor.save_kmeans_to(TrainingRun.get_path(run.pk, 'kmeans.joblib'))
+    predictor.save_index_to(TrainingRun.get_path(run.pk, 'index.json'))
+    viewport_index.save_to(TrainingRun.get_path(run.pk, 'viewport.joblib'))
+    viewer.save_map_to(TrainingRun.get_path(run.pk, 'folium.html'))
+    HotspotCube.build(predictor.get_df(), predictor.get_counts(), len(hotspot), settings.ML_HOTSPOT_HORIZON).save_to(
+        TrainingRun.get_path(run.pk, 'cube.json'))
+    profiler.start('database', len(hotspot))
+    save_results(predictor.iter_results(), job.pk if job is not None else 0, run.pk)
+    ClusterMonthCount.save_table(predictor.get_counts(), run.pk)
+    profiler.start('activate')
+    activate_run(run)
+    profiler.stop()
+
+
+def run_incremental(job, profiler=None):
+    profiler = profiler or StageProfiler()
+    update_progress(job, 'dataframe', 0.0, profiler)
+    current = TrainingRun.get_active_pk()
+    kmeans = load(TrainingRun.get_path(current, 'kmeans.joblib'))
+    viewport_index = load(TrainingRun.get_path(current, 'viewport.joblib'))
+    counts = ClusterMonthCount.get_table(ClusterMonthCount.objects.filter(run=current))
+    n_clusters, n_months = kmeans.n_clusters, int(counts['MES'].max())
+    df = HotspotPredictor.load_dataframe(job.filepaths, settings.ML_LOAD_WORKERS, settings.ML_TRAINING_CHUNKSIZE,
+                                         first_month=n_months + 1)
+    profiler.set_rows('dataframe', len(df))
+
+    update_progress(job, 'hotspot', 0.3, profiler)
+    profiler.set_rows('hotspot', len(df))
+    df['GRUPO'] = kmeans.predict(df[['LATITUDE', 'LONGITUDE']].to_numpy()).astype(
+        HotspotPredictor.get_cluster_dtype(n_clusters))
+    new_counts = df.groupby(['GRUPO', 'MES']).size().reset_index()
+    new_counts.columns = ['GRUPO', 'MES', 'COUNT']
+    all_counts = pd.concat([counts, new_counts], ignore_index=True)
+    hotspot = HotspotPredictor.predict_hotspot(all_counts, n_clusters, n_months + len(job.filepaths) + 1)
+    flags = [bool(hotspot[cluster]) for cluster in range(n_clusters)]
+
+    update_progress(job, 'publish', 0.6, profiler)
+    new_points = dict(HotspotPredictor.iter_points(df, hotspot, n_clusters))
+    old_flags = dict(ClusterData.objects.filter(run=current).values_list('cluster', 'hotspot'))
+    changed = [cluster for cluster in range(n_clusters)
+               if new_points[cluster] or flags[cluster] != old_flags.get(cluster)]
+    profiler.set_rows('publish', len(changed))
+    run = TrainingRun.objects.create(job=job)
+    os.makedirs(run.get_directory(), exist_ok=True)
+    copy_run(ClusterData, current, run.pk)
+    copy_run(ClusterMonthCount, current, run.pk)
+    ClusterMonthCount.save_table(new_counts, run.pk)
+    modified = timezone.now()
+    for start in range(0, len(changed), settings.ML_PUBLISH_BATCH_SIZE):
+        objs = list(ClusterData.objects.filter(run=run.pk,
+                                               cluster__in=changed[start:start + settings.ML_PUBLISH_BATCH_SIZE]))
+        for obj in objs:
+            obj.set_data(merge_cluster_data(obj.data, new_points[obj.cluster], flags[obj.cluster]))
+            obj.version = job.pk
+            obj.modified = modified
+        ClusterData.objects.bulk_update(objs, ['data', 'hotspot', 'content_gzip', 'version', 'modified'])
+    clusters_data = (obj.data for obj in ClusterData.objects.filter(run=run.pk).only('data').iterator())
+    shutil.copyfile(TrainingRun.get_path(current, 'kmeans.joblib'), TrainingRun.get_path(run.pk, 'kmeans.joblib'))
+    CentroidIndex(kmeans.cluster_centers_, flags).save_to(TrainingRun.get_path(run.pk, 'index.json'))
+    viewport_index.extend(flags, df).save_to(TrainingRun.get_path(run.pk, 'viewport.joblib'))
+    HotspotViewer(clusters_data=clusters_data, mode=settings.ML_MAP_MODE).save_map_to(
+        TrainingRun.get_path(run.pk, 'folium.html'))
+    try:
+        cube = HotspotCube.load(TrainingRun.get_path(current, 'cube.json')).extend(df, all_counts,
+                                                                                  settings.ML_HOTSPOT_HORIZON)
+    except FileNotFoundError:
+        cube = HotspotCube.build(df, all_counts, n_clusters, settings.ML_HOTSPOT_HORIZON)
+    cube.save_to(TrainingRun.get_path(run.pk, 'cube.json'))
+    activate_run(run)
+    job.metadata.update(changed_clusters=len(changed), new_rows=len(df), run=run.pk)
+
+
+def merge_cluster_data(data, points, hotspot):
+    features = data['features'][:-1] + points + data['features'][-1:]
+    for feature in features:
+        feature['hotspot'] = hotspot
+    data['features'] = features
+    data['hotspot'] = hotspot
+    return data
+
+
+def activate_run(run):
+    previous = run.activate()
+    if not previous:
+        ClusterData.objects.filter(run=None).delete()
+        ClusterMonthCount.objects.filter(run=None).delete()
+    collect_runs()
+    return previous
+
+
+def rollback_run():
+    run = TrainingRun.objects.filter(active=False, activated_at__isnull=False).order_by('-activated_at').first()
+    if run is not None:
+        activate_run(run)
+    return run
+
+
+def collect_runs(keep=None):
+    keep = settings.ML_TRAINING_RUNS_KEEP if keep is None else keep
+    runs = list(TrainingRun.objects.filter(active=False, activated_at__isnull=False).order_by('-activated_at')[keep:])
+    for run in runs:
+        delete_run(run)
+    return runs
+
+
+def delete_run(run):
+    shutil.rmtree(run.get_directory(), ignore_errors=True)
+    run.delete()
+
+
+def save_results(clusters_data, version=0, run=None):
+    modified = timezone.now()
+    ClusterData.objects.filter(run=run).delete()
+    objs = []
+    for data in clusters_data:
+        obj = ClusterData(version=version, run_id=run, modified=modified)
+        obj.set_data(data)
+        objs.append(obj)
+        if len(objs) >= settings.ML_PUBLISH_BATCH_SIZE:
+            ClusterData.save_batch(objs)
+            objs = []
+    ClusterData.save_batch(objs)
+
+
+def convert_index(run=None):
+    address = TrainingRun.get_path(run, 'index.json')
+    if os.path.exists(address):
+        return False
+    kmeans = load(TrainingRun.get_path(run, 'kmeans.joblib'))
+    flags = dict(ClusterData.objects.filter(run=run).values_list('cluster', 'hotspot'))
+    CentroidIndex(kmeans.cluster_centers_, [flags.get(cluster, False) for cluster in range(kmeans.n_clusters)]).save_to(
+        address)
+    return True
+
+
+def discard_runs(job):
+    for run in TrainingRun.objects.filter(job=job, active=False, activated_at__isnull=True):
+        delete_run(run)
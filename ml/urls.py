@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
@@ -9,6 +10,12 @@ urlpatterns = [
     path('configure', views.configure, name='configure'),
     path('delete', views.delete, name='delete'),
     path('train', views.train, name='train'),
-    path('api', views.api, name='api'),
+    path('jobs/<int:pk>', views.job, name='job'),
+    path('jobs/<int:pk>/status', views.job_status, name='job_status'),
+    path('api', views.api_async if settings.ML_ASYNC_API else views.api, name='api'),
+    path('api/batch', views.api_batch_async if settings.ML_ASYNC_API else views.api_batch, name='api_batch'),
+    path('api/bbox', views.api_bbox, name='api_bbox'),
+    path('api/counts', views.api_counts, name='api_counts'),
+    path('api/hotspots', views.api_hotspots, name='api_hotspots'),
     path('view', views.view, name='view'),
 ]
@@ -0,0 +1,107 @@
+import os
+import numpy as np
+import pandas as pd
+from joblib import dump
+
+
+class ViewportIndex(object):
+
+    def __init__(self, boundaries, hotspot, df, cell_size=0.01):
+        self._hotspot = np.asarray(hotspot, dtype='bool')
+        self._polygons = [boundaries.get(cluster, []) for cluster in range(len(self._hotspot))]
+        self._bounds = np.full((len(self._polygons), 4), np.nan)
+        for cluster, polygon in enumerate(self._polygons):
+            if polygon:
+                coordinates = np.asarray(polygon)
+                self._bounds[cluster] = np.r_[coordinates.min(axis=0), coordinates.max(axis=0)]
+
+        points = np.round(df[['LATITUDE', 'LONGITUDE']].to_numpy(dtype='float64'), 6)
+        self._cell_size = cell_size
+        self._origin = points.min(axis=0) if len(points) else np.zeros(2)
+        cells = np.floor((points - self._origin) / cell_size).astype('int64')
+        self._n_rows = int(cells[:, 0].max()) + 1 if len(points) else 1
+        self._n_cols = int(cells[:, 1].max()) + 1 if len(points) else 1
+        keys = cells[:, 0] * self._n_cols + cells[:, 1]
+        order = np.argsort(keys, kind='stable')
+        self._keys = keys[order]
+        self._points = points[order]
+        self._clusters = df['GRUPO'].to_numpy(dtype='int32')[order]
+        self._dates, self._date_codes = self._encode(df['DATAOCORRENCIA'], order)
+        self._times, self._time_codes = self._encode(df['HORAOCORRENCIA'], order)
+
+    def query_clusters(self, south, west, north, east):
+        min_lat, min_lon, max_lat, max_lon = self._bounds.T
+        with np.errstate(invalid='ignore'):
+            mask = (min_lat <= north) & (max_lat >= south) & (min_lon <= east) & (max_lon >= west)
+        return np.flatnonzero(mask)
+
+    def query_points(self, south, west, north, east, clusters=None):
+        if not len(self._points):
+            return np.empty(0, dtype='int64')
+        first_row, first_col = np.floor((np.array([south, west]) - self._origin) / self._cell_size).astype('int64')
+        last_row, last_col = np.floor((np.array([north, east]) - self._origin) / self._cell_size).astype('int64')
+        first_row, first_col = max(first_row, 0), max(first_col, 0)
+        last_row, last_col = min(last_row, self._n_rows - 1), min(last_col, self._n_cols - 1)
+        if first_row > last_row or first_col > last_col:
+            return np.empty(0, dtype='int64')
+        rows = np.arange(first_row, last_row + 1) * self._n_cols
+        starts = np.searchsorted(self._keys, rows + first_col, side='left')
+        ends = np.searchsorted(self._keys, rows + last_col, side='right')
+        candidates = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+        points = self._points[candidates]
+        mask = (points[:, 0] >= south) & (points[:, 0] <= north) & (points[:, 1] >= west) & (points[:, 1] <= east)
+        if clusters is not None:
+            mask &= np.isin(self._clusters[candidates], clusters)
+        return candidates[mask]
+
+    def get_polygon(self, cluster):
+        return {
+            'type': 'Feature',
+            'geometry': {
+                'type': 'LineString',
+                'coordinates': self._polygons[cluster]
+            },
+            'hotspot': bool(self._hotspot[cluster]),
+            'cluster': int(cluster)
+        }
+
+    def get_points(self, idxs):
+        clusters = self._clusters[idxs].tolist()
+        hotspots = self._hotspot[clusters].tolist()
+        dates = self._dates[self._date_codes[idxs]].tolist()
+        times = self._times[self._time_codes[idxs]].tolist()
+        return [{
+            'type': 'Feature',
+            'geometry': {
+                'type': 'Point',
+                'coordinates': coordinates
+            },
+            'properties': {
+                'date': date,
+                'time': time
+            },
+            'hotspot': hotspot,
+            'cluster': cluster
+        } for coordinates, date, time, hotspot, cluster in zip(self._points[idxs].tolist(), dates, times, hotspots,
+                                                                 clusters)]
+
+    def extend(self, hotspot, df):
+        current = pd.DataFrame({
+            'LATITUDE': self._points[:, 0],
+            'LONGITUDE': self._points[:, 1],
+            'GRUPO': self._clusters,
+            'DATAOCORRENCIA': self._dates[self._date_codes],
+            'HORAOCORRENCIA': self._times[self._time_codes]
+        })
+        df = df[current.columns].astype({'DATAOCORRENCIA': object, 'HORAOCORRENCIA': object})
+        boundaries = {cluster: polygon for cluster, polygon in enumerate(self._polygons)}
+        return ViewportIndex(boundaries, hotspot, pd.concat([current, df], ignore_index=True), self._cell_size)
+
+    def save_to(self, address):
+        dump(self, address + '.tmp')
+        os.replace(address + '.tmp', address)
+
+    @staticmethod
+    def _encode(series, order):
+        series = series.astype('category')
+        return series.cat.categories.to_numpy(dtype=object), series.cat.codes.to_numpy()[order]
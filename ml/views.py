@@ -1,20 +1,40 @@
+import gzip
+import json
+from asgiref.sync import sync_to_async
+import numpy as np
 from django.contrib.auth.decorators import login_required
 from django.conf import settings
 from django.contrib import messages
+from django.http import HttpResponse
+from django.http import HttpResponseBadRequest
+from django.http import HttpResponseNotAllowed
 from django.http import HttpResponseRedirect
 from django.http import HttpResponseNotFound
 from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
 from django.shortcuts import render
 from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from .forms import ChoiceFileForm
 from .forms import UploadFileForm
 from .forms import SelectFileForm
 from .forms import NumberClusterForm
 from .models import UploadFile
 from .models import ClusterData
-from ml.hotspot_predictor import HotspotPredictor
-from ml.hotspot_viewer import HotspotViewer
-from joblib import load
+from .models import ClusterMonthCount
+from .models import TrainingJob
+from .models import TrainingRun
+from ml import dataframe_cache
+from ml import hotspot_regression
+from ml.lookup_cache import lookup_cache
+from ml.model_registry import registry
+
+MISSING = object()
 
 
 @login_required
@@ -57,6 +77,7 @@ def delete(request):
         if pks:
             files = UploadFile.objects.filter(id__in=pks)
             for file in files:
+                dataframe_cache.remove(file.file.path)
                 file.file.delete(save=True)
                 file.delete()
     return HttpResponseRedirect(reverse('ml:index'))
@@ -67,22 +88,31 @@ def train(request):
     if request.method == 'POST':
         filepaths = request.POST.getlist('filepath')
         n_clusters_form = NumberClusterForm(request.POST)
+        if not set(filepaths) <= {file.file.path for file in UploadFile.objects.all()}:
+            messages.warning(request, 'Arquivo não encontrado', extra_tags='warning')
+            return HttpResponseRedirect(reverse('ml:index'))
         if filepaths and n_clusters_form.is_valid():
             n_clusters = n_clusters_form.cleaned_data['n_clusters']
-            predictor = HotspotPredictor(filepaths=filepaths, n_clusters=n_clusters)
-            predictor.save_kmeans_to(settings.MEDIA_ROOT + '/kmeans.joblib')
-            clusters_data = predictor.get_results()
-            save_results(clusters_data)
-            HotspotViewer(clusters_data=clusters_data).save_map_to(settings.MEDIA_ROOT + '/folium.html')
-            messages.success(request, 'Treinamento concluído com sucesso', extra_tags='success')
-            return HttpResponseRedirect(reverse('ml:index'))
+            incremental = n_clusters_form.cleaned_data['incremental']
+            sweep = n_clusters_form.cleaned_data['sweep'] and not incremental
+            min_clusters = n_clusters_form.cleaned_data['min_clusters'] if sweep else None
+            job = TrainingJob.objects.create(filepaths=filepaths, n_clusters=n_clusters, incremental=incremental,
+                                             sweep=sweep, min_clusters=min_clusters)
+            messages.success(request, 'Treinamento adicionado à fila', extra_tags='success')
+            return HttpResponseRedirect(reverse('ml:job', args=[job.pk]))
     return HttpResponseRedirect(reverse('index:index'))
 
 
-def save_results(clusters_data):
-    objs = [ClusterData(data=data) for data in clusters_data]
-    ClusterData.objects.all().delete()
-    ClusterData.objects.bulk_create(objs)
+@login_required
+def job(request, pk):
+    training_job = get_object_or_404(TrainingJob, pk=pk)
+    return render(request, 'ml/job.html', {'job': training_job})
+
+
+@login_required
+def job_status(request, pk):
+    training_job = get_object_or_404(TrainingJob, pk=pk)
+    return JsonResponse(training_job.to_dict())
 
 
 def api(request):
@@ -90,23 +120,302 @@ def api(request):
     longitude = request.GET.get('longitude', None)
     if latitude and longitude:
         try:
-            kmeans = load(settings.MEDIA_ROOT + '/kmeans.joblib')
-            cluster = kmeans.predict([[latitude, longitude]])
-            obj = ClusterData.objects.filter(data__cluster=int(cluster[0]))
+            run = get_run(request)
+            index = registry.get(TrainingRun.get_path(run, 'index.json'))
+            cluster = index.query([latitude, longitude])
+            obj = get_cluster(run, int(cluster[0]))
             if obj:
-                return JsonResponse(obj[0].data)
+                return cluster_response(request, obj.get_etag(), obj.modified, bytes(obj.content_gzip))
             else:
                 messages.warning(request, 'Objeto não encontrado no Banco de Dados', extra_tags='warning')
+        except ValueError:
+            return HttpResponseBadRequest('Parâmetros inválidos')
+        except FileNotFoundError:
+            return HttpResponseNotFound('Arquivo não encontrado')
+    return HttpResponseRedirect(reverse('index:index'))
+
+
+async def api_async(request):
+    latitude = request.GET.get('latitude', None)
+    longitude = request.GET.get('longitude', None)
+    if latitude and longitude:
+        try:
+            run = await get_run_async(request)
+            index = await sync_to_async(registry.get, thread_sensitive=False)(TrainingRun.get_path(run, 'index.json'))
+            cluster = int(index.query([latitude, longitude])[0])
+        except ValueError:
+            return HttpResponseBadRequest('Parâmetros inválidos')
         except FileNotFoundError:
             return HttpResponseNotFound('Arquivo não encontrado')
+        entry = lookup_cache.get(run, cluster)
+        if entry is None:
+            entry = await sync_to_async(get_cluster_entry)(run, cluster)
+        if entry:
+            return cluster_response(request, *entry)
+        messages.warning(request, 'Objeto não encontrado no Banco de Dados', extra_tags='warning')
     return HttpResponseRedirect(reverse('index:index'))
 
 
+def get_cluster(run, cluster):
+    return ClusterData.objects.filter(run=run, cluster=cluster).defer('data').first()
+
+
+def get_cluster_entry(run, cluster):
+    obj = ClusterData.objects.filter(run=run, cluster=cluster).only(
+        'run', 'cluster', 'version', 'modified', 'content_gzip').first()
+    if obj is None:
+        return None
+    entry = (obj.get_etag(), obj.modified, bytes(obj.content_gzip))
+    if TrainingRun.objects.filter(pk=run, activated_at__isnull=False).exists():
+        lookup_cache.put(run, cluster, *entry)
+    return entry
+
+
+def cluster_response(request, etag, modified, content_gzip):
+    response = get_conditional_response(request, etag=etag, last_modified=int(modified.timestamp()))
+    if response is None:
+        if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+            response = HttpResponse(content_gzip, content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(gzip.decompress(content_gzip), content_type='application/json')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modified.timestamp())
+    response['Cache-Control'] = 'no-cache'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+@csrf_exempt
+@require_POST
+def api_batch(request):
+    points, error = read_points(request)
+    if error is not None:
+        return error
+    try:
+        run = get_run(request)
+        response, clusters = get_batch(request, run, points)
+    except ValueError:
+        return HttpResponseBadRequest('Parâmetros inválidos')
+    except FileNotFoundError:
+        return HttpResponseNotFound('Arquivo não encontrado')
+    if request.GET.get('features'):
+        clusters = np.unique(clusters)
+        if len(clusters) > settings.ML_BATCH_MAX_CLUSTERS:
+            return HttpResponseBadRequest('Número máximo de agrupamentos excedido')
+        response['collections'] = get_collections(run, clusters)
+    return JsonResponse(response)
+
+
+async def api_batch_async(request):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    points, error = read_points(request)
+    if error is not None:
+        return error
+    try:
+        run = await get_run_async(request)
+        response, clusters = await sync_to_async(get_batch, thread_sensitive=False)(request, run, points)
+    except ValueError:
+        return HttpResponseBadRequest('Parâmetros inválidos')
+    except FileNotFoundError:
+        return HttpResponseNotFound('Arquivo não encontrado')
+    if request.GET.get('features'):
+        clusters = np.unique(clusters)
+        if len(clusters) > settings.ML_BATCH_MAX_CLUSTERS:
+            return HttpResponseBadRequest('Número máximo de agrupamentos excedido')
+        response['collections'] = await sync_to_async(get_collections)(run, clusters)
+    return JsonResponse(response)
+
+
+api_batch_async.csrf_exempt = True
+
+
+def read_points(request):
+    try:
+        points = parse_points(request.body, request.content_type)
+    except (ValueError, TypeError, KeyError):
+        return None, HttpResponseBadRequest('Coordenadas inválidas')
+    if len(points) > settings.ML_BATCH_MAX_POINTS:
+        return None, HttpResponseBadRequest('Número máximo de coordenadas excedido')
+    return points, None
+
+
+def get_batch(request, run, points):
+    time = get_time(request)
+    index = registry.get(TrainingRun.get_path(run, 'index.json'))
+    clusters = index.query(points)
+    hotspots = index.is_hotspot(clusters)
+    response = {}
+    if time is not None:
+        cube = registry.get(TrainingRun.get_path(run, 'cube.json'))
+        response['month'] = int(request.GET['month']) if 'month' in request.GET else cube.get_month(time)
+        _, hotspots = cube.query(response['month'], time.weekday(), time.hour, clusters)
+    response['results'] = [{'latitude': latitude, 'longitude': longitude, 'cluster': cluster, 'hotspot': hotspot}
+                           for (latitude, longitude), cluster, hotspot in zip(points.tolist(), clusters.tolist(),
+                                                                               hotspots.tolist())]
+    return response, clusters
+
+
+def get_collections(run, clusters):
+    objs = ClusterData.objects.filter(run=run, cluster__in=clusters.tolist())
+    return {obj.cluster: obj.data for obj in objs}
+
+
+def api_counts(request):
+    try:
+        clusters = [int(cluster) for cluster in request.GET.getlist('cluster')]
+        run = get_run(request)
+    except ValueError:
+        return HttpResponseBadRequest('Parâmetros inválidos')
+    queryset = ClusterMonthCount.objects.filter(run=run).order_by('cluster', 'month')
+    if clusters:
+        queryset = queryset.filter(cluster__in=clusters)
+    return JsonResponse({'counts': list(queryset.values('cluster', 'month', 'count'))})
+
+
+def api_hotspots(request):
+    try:
+        run = get_run(request)
+        time = get_time(request)
+    except ValueError:
+        return HttpResponseBadRequest('Parâmetros inválidos')
+    if time is not None:
+        return api_hotspots_at(request, run, time)
+    counts = ClusterMonthCount.get_table(ClusterMonthCount.objects.filter(run=run))
+    if counts.empty:
+        return HttpResponseNotFound('Contagens não encontradas')
+    try:
+        month = int(request.GET.get('month', counts['MES'].max() + 1))
+        index = registry.get(TrainingRun.get_path(run, 'index.json'))
+    except ValueError:
+        return HttpResponseBadRequest('Parâmetros inválidos')
+    except FileNotFoundError:
+        return HttpResponseNotFound('Arquivo não encontrado')
+    hotspot = hotspot_regression.predict_hotspot(counts, index.get_n_clusters(), month)
+    return JsonResponse({'month': month, 'hotspots': [cluster for cluster, value in hotspot.items() if value]})
+
+
+def api_hotspots_at(request, run, time):
+    try:
+        cube = registry.get(TrainingRun.get_path(run, 'cube.json'))
+        month = int(request.GET['month']) if 'month' in request.GET else cube.get_month(time)
+        scores, hotspot = cube.query(month, time.weekday(), time.hour)
+    except ValueError:
+        return HttpResponseBadRequest('Parâmetros inválidos')
+    except FileNotFoundError:
+        return HttpResponseNotFound('Arquivo não encontrado')
+    response = {'month': month, 'weekday': time.weekday(), 'hour': time.hour,
+                'hotspots': np.flatnonzero(hotspot).tolist()}
+    if request.GET.get('scores'):
+        response['scores'] = scores.tolist()
+    return JsonResponse(response)
+
+
+def api_bbox(request):
+    try:
+        south, west, north, east = [float(request.GET[key]) for key in ['south', 'west', 'north', 'east']]
+        page = int(request.GET.get('page', 1))
+        page_size = min(int(request.GET.get('page_size', settings.ML_VIEWPORT_PAGE_SIZE)),
+                        settings.ML_VIEWPORT_PAGE_SIZE)
+        max_points = min(int(request.GET.get('max_points', settings.ML_VIEWPORT_MAX_POINTS)),
+                         settings.ML_VIEWPORT_MAX_POINTS)
+        run = get_run(request)
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest('Parâmetros inválidos')
+    if not np.isfinite([south, west, north, east]).all() or south > north or west > east or south < -90 \
+            or north > 90 or west < -180 or east > 180 or page < 1 or page_size < 1 or max_points < 0:
+        return HttpResponseBadRequest('Parâmetros inválidos')
+    try:
+        index = registry.get(TrainingRun.get_path(run, 'viewport.joblib'))
+    except FileNotFoundError:
+        return HttpResponseNotFound('Arquivo não encontrado')
+    clusters = index.query_clusters(south, west, north, east)
+    n_pages = max((len(clusters) + page_size - 1) // page_size, 1)
+    clusters = clusters[(page - 1) * page_size:page * page_size]
+    features = [index.get_polygon(cluster) for cluster in clusters]
+    truncated = False
+    if request.GET.get('points') and len(clusters):
+        idxs = index.query_points(south, west, north, east, clusters)
+        truncated = len(idxs) > max_points
+        features += index.get_points(idxs[:max_points])
+    return JsonResponse({
+        'type': 'FeatureCollection',
+        'features': features,
+        'page': page,
+        'pages': n_pages,
+        'truncated': truncated
+    })
+
+
+def get_run(request):
+    run = request.GET.get('run')
+    if run is None:
+        return TrainingRun.get_active_pk()
+    return int(run) or None
+
+
+async def get_run_async(request):
+    run = request.GET.get('run')
+    if run is not None:
+        return int(run) or None
+    active = lookup_cache.get_active(MISSING)
+    if active is MISSING:
+        active = await sync_to_async(TrainingRun.get_active_pk)()
+        lookup_cache.set_active(active)
+    return active
+
+
+def get_time(request):
+    time = request.GET.get('time')
+    if not time:
+        return None
+    time = parse_datetime(time)
+    if time is None:
+        raise ValueError('Data inválida')
+    return time
+
+
+def parse_points(body, content_type):
+    text = body.decode('utf-8')
+    if content_type == 'text/csv':
+        rows = [line.split(',') for line in text.splitlines() if line.strip()]
+        if rows and not is_number(rows[0][0]):
+            rows = rows[1:]
+        points = [parse_point(row[:2]) for row in rows]
+    elif content_type == 'application/x-ndjson':
+        points = [parse_point(json.loads(line)) for line in text.splitlines() if line.strip()]
+    else:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = data['points']
+        points = [parse_point(point) for point in data]
+    points = np.asarray(points, dtype='float64').reshape(-1, 2)
+    if not np.isfinite(points).all():
+        raise ValueError('Coordenadas inválidas')
+    return points
+
+
+def is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def parse_point(point):
+    if isinstance(point, dict):
+        return point['latitude'], point['longitude']
+    latitude, longitude = point
+    return latitude, longitude
+
+
 def view(request):
     try:
-        with open(settings.MEDIA_ROOT + '/folium.html', 'r') as f:
+        with open(TrainingRun.get_path(get_run(request), 'folium.html'), 'r') as f:
             folium_map = f.read()
             return render(request, 'ml/view.html', {'map': folium_map})
-    except FileNotFoundError:
+    except (ValueError, FileNotFoundError):
         messages.warning(request, 'Arquivo não encontrado', extra_tags='warning')
         return HttpResponseRedirect(reverse('index:index'))
@@ -0,0 +1,91 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from scipy.spatial import QhullError
+from scipy.spatial import Delaunay
+
+BOUNDS = (-25.4, -53.2, -19.7, -44.0)
+MARGIN = 0.01
+CACHE_SIZE = 4
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_boundaries(centers, bounds=BOUNDS):
+    centers = np.ascontiguousarray(centers, dtype='float64')
+    key = hashlib.sha1(centers.tobytes()).hexdigest(), centers.shape, tuple(bounds)
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    boundaries = get_polygons(centers, bounds)
+    with _lock:
+        _cache[key] = boundaries
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return boundaries
+
+
+def get_extent(points, bounds=BOUNDS):
+    south, west, north, east = bounds
+    low = np.minimum([south, west], points.min(axis=0) - MARGIN)
+    high = np.maximum([north, east], points.max(axis=0) + MARGIN)
+    return low[0], low[1], high[0], high[1]
+
+
+def get_polygons(points, bounds=BOUNDS):
+    points, inverse = np.unique(np.asarray(points, dtype='float64'), axis=0, return_inverse=True)
+    south, west, north, east = get_extent(points, bounds)
+    outer = points[get_outer(points, south, west, north, east)]
+    latitudes, longitudes = outer[:, 0], outer[:, 1]
+    tri = Delaunay(np.concatenate([
+        points,
+        np.c_[2 * south - latitudes, longitudes],
+        np.c_[2 * north - latitudes, longitudes],
+        np.c_[latitudes, 2 * west - longitudes],
+        np.c_[latitudes, 2 * east - longitudes]
+    ]))
+
+    owners = tri.simplices.ravel()
+    vertices = np.repeat(get_circumcenters(tri), 3, axis=0)
+    mask = (owners < len(points)) & np.isfinite(vertices).all(axis=1)
+    owners, vertices = owners[mask], np.clip(vertices[mask], [south, west], [north, east])
+    sizes = np.bincount(owners, minlength=len(points))
+    centroids = np.c_[np.bincount(owners, vertices[:, 0], len(points)),
+                      np.bincount(owners, vertices[:, 1], len(points))] / sizes[:, None]
+    angles = np.arctan2(vertices[:, 1] - centroids[owners, 1], vertices[:, 0] - centroids[owners, 0])
+    order = np.lexsort((angles, owners))
+    owners, vertices = owners[order], vertices[order]
+    repeated = (owners[1:] == owners[:-1]) & (np.abs(vertices[1:] - vertices[:-1]) < 1e-12).all(axis=1)
+    unique = np.r_[True, ~repeated]
+    owners, vertices = owners[unique], vertices[unique]
+    sizes = np.bincount(owners, minlength=len(points))
+    polygons = [polygon.tolist() for polygon in np.split(vertices, np.cumsum(sizes)[:-1])]
+    return {cluster: polygons[idx] for cluster, idx in enumerate(inverse.reshape(-1).tolist())}
+
+
+def get_outer(points, south, west, north, east):
+    try:
+        tri = Delaunay(points)
+    except QhullError:
+        return np.ones(len(points), dtype='bool')
+    centers = get_circumcenters(tri)
+    outside = ~np.isfinite(centers).all(axis=1)
+    with np.errstate(invalid='ignore'):
+        outside |= (centers[:, 0] < south) | (centers[:, 0] > north) | (centers[:, 1] < west) | (centers[:, 1] > east)
+    outer = np.zeros(len(points), dtype='bool')
+    outer[tri.simplices[outside].ravel()] = True
+    outer[tri.convex_hull.ravel()] = True
+    return outer
+
+
+def get_circumcenters(tri):
+    origins = tri.points[tri.simplices[:, 0]]
+    b = tri.points[tri.simplices[:, 1]] - origins
+    c = tri.points[tri.simplices[:, 2]] - origins
+    b_norms, c_norms = (b ** 2).sum(axis=1), (c ** 2).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offsets = np.c_[c[:, 1] * b_norms - b[:, 1] * c_norms, b[:, 0] * c_norms - c[:, 0] * b_norms]
+        return origins + offsets / (2 * (b[:, 0] * c[:, 1] - b[:, 1] * c[:, 0]))[:, None]
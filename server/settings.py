@@ -123,3 +123,43 @@ MEDIA_URL = '/data/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'data')
 
 LOGIN_URL = '/login'
+
+ML_BATCH_MAX_POINTS = int(os.environ.get('ML_BATCH_MAX_POINTS', 100000))
+
+ML_BATCH_MAX_CLUSTERS = int(os.environ.get('ML_BATCH_MAX_CLUSTERS', 50))
+
+ML_VIEWPORT_PAGE_SIZE = int(os.environ.get('ML_VIEWPORT_PAGE_SIZE', 500))
+
+ML_VIEWPORT_MAX_POINTS = int(os.environ.get('ML_VIEWPORT_MAX_POINTS', 5000))
+
+ML_TRAINING_WORKERS = int(os.environ.get('ML_TRAINING_WORKERS', 1))
+
+ML_TRAINING_POLL = float(os.environ.get('ML_TRAINING_POLL', 5))
+
+ML_TRAINING_LEASE = float(os.environ.get('ML_TRAINING_LEASE', 60))
+
+ML_LOAD_WORKERS = int(os.environ.get('ML_LOAD_WORKERS', 1))
+
+ML_TRAINING_CHUNKSIZE = int(os.environ.get('ML_TRAINING_CHUNKSIZE', 0)) or None
+
+ML_MAP_MODE = os.environ.get('ML_MAP_MODE', 'heatmap')
+
+ML_SWEEP_WORKERS = int(os.environ.get('ML_SWEEP_WORKERS', 1))
+
+ML_SWEEP_STEPS = int(os.environ.get('ML_SWEEP_STEPS', 6))
+
+ML_SWEEP_SAMPLE = int(os.environ.get('ML_SWEEP_SAMPLE', 5000))
+
+ML_TRAINING_CPROFILE = bool(int(os.environ.get('ML_TRAINING_CPROFILE', 0)))
+
+ML_PUBLISH_BATCH_SIZE = int(os.environ.get('ML_PUBLISH_BATCH_SIZE', 100))
+
+ML_TRAINING_RUNS_KEEP = int(os.environ.get('ML_TRAINING_RUNS_KEEP', 2))
+
+ML_HOTSPOT_HORIZON = int(os.environ.get('ML_HOTSPOT_HORIZON', 3))
+
+ML_ASYNC_API = bool(int(os.environ.get('ML_ASYNC_API', 0)))
+
+ML_LOOKUP_CACHE_BYTES = int(os.environ.get('ML_LOOKUP_CACHE_BYTES', 64 * 2 ** 20))
+
+ML_ACTIVE_RUN_TTL = float(os.environ.get('ML_ACTIVE_RUN_TTL', 1))